@@ -0,0 +1,59 @@
+# coding=utf-8
+"""
+Замер влияния дублирования медленных GET запросов ( Hedger ) на хвост задержек на локальном mock сервере
+ с логнормальными задержками и долей очень медленных ответов.
+
+Measures the effect of hedging slow GET requests ( Hedger ) on tail latency on a local mock server with
+ log-normal latencies and a share of very slow responses.
+
+    python benchmarks/hedging_benchmark.py --requests 2000 --jobs 20 --slow-share 0.03 --budget 0.1
+"""
+import os
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from moyclass import MoyClassTransport, Hedger  # noqa: E402
+from mock_server import MockMoyClassServer, lognormal_latency  # noqa: E402
+from http2_benchmark import run  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--jobs', type=int, default=20, help="number of concurrent requests")
+    parser.add_argument('--median', type=float, default=0.02, help="median server latency in seconds")
+    parser.add_argument('--slow-share', type=float, default=0.03, help="share of very slow responses")
+    parser.add_argument('--slow-latency', type=float, default=0.2, help="latency of very slow responses")
+    parser.add_argument('--quantile', type=float, default=0.95, help="latency quantile after which a copy is sent")
+    parser.add_argument('--budget', type=float, default=0.1, help="maximal share of extra requests")
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    server = MockMoyClassServer(latency_fn=lognormal_latency(args.median, slow_share=args.slow_share,
+                                                             slow_latency=args.slow_latency)).start()
+    hedger = Hedger(quantile=args.quantile, budget=args.budget)
+    transports = [('plain', MoyClassTransport(pool_size=args.jobs * 2)),
+                  ('hedged', MoyClassTransport(pool_size=args.jobs * 2, hedging=hedger))]
+
+    print(f"{args.requests} pages, {args.jobs} concurrent requests, {args.median * 1000:.0f} ms median latency, "
+          f"{args.slow_share:.0%} responses take {args.slow_latency * 1000:.0f} ms")
+    print(f"{'transport':<10}{'seconds':>10}{'p50 ms':>10}{'p99 ms':>10}{'served':>10}")
+    results = {}
+    for name, transport in transports:
+        # the warm up also collects latencies the hedging delay is computed from
+        run(transport, server, max(args.jobs, hedger.min_samples * 2), args.jobs, args.page_size)
+        results[name] = result = run(transport, server, args.requests, args.jobs, args.page_size)
+        print(f"{name:<10}{result['seconds']:>10.2f}{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}"
+              f"{result['served']:>10}")
+        transport.close()
+    server.stop()
+    print(f"hedged {hedger.stats['hedged']} of {hedger.stats['requests']} requests, "
+          f"{hedger.stats['hedge_wins']} copies answered first, "
+          f"p99 ratio plain / hedged: {results['plain']['p99'] / results['hedged']['p99']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
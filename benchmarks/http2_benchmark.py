@@ -0,0 +1,83 @@
+# coding=utf-8
+"""
+Сравнение транспорта HTTP/1.1 ( пул соединений requests ) и HTTP/2 ( httpx ) на локальном mock сервере.
+
+Compares HTTP/1.1 transport ( requests connection pool ) with HTTP/2 transport ( httpx ) on a local mock server.
+
+    python benchmarks/http2_benchmark.py --requests 1000 --jobs 100 --latency 0.05
+
+HTTP/2 part requires httpx[http2].
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from moyclass import MoyClassTransport, MoyClassHttp2Transport, httpx  # noqa: E402
+from mock_server import MockMoyClassServer  # noqa: E402
+
+
+def run(transport, server, requests_num, jobs, page_size):
+    """
+    Загружает requests_num страниц в jobs потоков и возвращает результаты замера
+
+    Loads requests_num pages in jobs threads and returns measurement results
+    """
+    served = server.requests
+    url = f"{server.url}/v1/company/lessons"
+
+    def load(number):
+        params = [['limit', page_size], ['offset', number * page_size]]
+        start = time.perf_counter()
+        transport.request('GET', url, params=params)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        latencies = sorted(executor.map(load, range(requests_num)))
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds,
+            'requests_per_second': requests_num / seconds,
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'served': server.requests - served}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=100, help="number of concurrent requests")
+    parser.add_argument('--latency', type=float, default=0.05, help="server latency in seconds")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--pool-size', type=int, default=20, help="HTTP/1.1 connection pool size")
+    parser.add_argument('--h2-connections', type=int, default=2, help="number of HTTP/2 connections")
+    args = parser.parse_args()
+    # urllib3 warns about every connection opened above the pool size
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    server = MockMoyClassServer(latency=args.latency).start()
+    transports = [('HTTP/1.1', MoyClassTransport(pool_size=args.pool_size))]
+    if (httpx is not None):
+        transports.append(('HTTP/2', MoyClassHttp2Transport(max_connections=args.h2_connections,
+                                                            prior_knowledge=True)))
+    else:
+        print("httpx is not installed, HTTP/2 transport is skipped ( pip install httpx[http2] )")
+
+    print(f"{args.requests} pages, {args.jobs} concurrent requests, {args.latency * 1000:.0f} ms server latency")
+    print(f"{'transport':<10}{'seconds':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'connections':>13}")
+    for name, transport in transports:
+        # connections are counted together with the warm up, which opens most of them
+        connections = server.connections
+        run(transport, server, min(args.jobs, args.requests), args.jobs, args.page_size)  # warm up
+        result = run(transport, server, args.requests, args.jobs, args.page_size)
+        print(f"{name:<10}{result['seconds']:>10.2f}{result['requests_per_second']:>10.0f}"
+              f"{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}{server.connections - connections:>13}")
+        transport.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
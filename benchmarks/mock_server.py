@@ -0,0 +1,204 @@
+# coding=utf-8
+"""
+Локальный mock сервер API moyklass.com для бенчмарков. Принимает HTTP/1.1 ( keep-alive ) и HTTP/2 без
+ шифрования ( h2c с prior knowledge ) на одном порту и отвечает страницами объектов с заданной задержкой.
+
+Local mock server of moyklass.com API for benchmarks. It accepts HTTP/1.1 ( keep-alive ) and cleartext
+ HTTP/2 ( h2c with prior knowledge ) on one port and answers with pages of entities after a given latency.
+
+HTTP/2 support requires h2 package ( installed with httpx[http2] ).
+"""
+import json
+import random
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+
+class MockMoyClassServer:
+    """
+    Example:
+        server = MockMoyClassServer(latency=0.05).start()
+        url = f"{server.url}/v1/company/lessons?limit=100&offset=0"
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.02, total_items=10000, latency_fn=None):
+        """
+        :param latency: delay of every response in seconds
+        :param total_items: number of entities of every entity type
+        :param latency_fn: function returning delay of a response ( overrides latency ), e.g. to model slow tails
+        """
+        self.host = host
+        self.port = port
+        self.latency_fn = latency_fn or (lambda: latency)
+        self.total_items = total_items
+        self.connections = 0
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def response(self, method, path):
+        """
+        Возвращает ( статус, тело ответа ) для запроса
+
+        Returns ( status, response body ) of the request
+        """
+        self.requests += 1
+        parts = urlsplit(path)
+        entity = parts.path.rstrip('/').split('/')[-1]
+        query = dict(parse_qsl(parts.query))
+        if (method == 'POST' and entity == 'getToken'):
+            return 200, json.dumps({'accessToken': 'mock-token'}).encode()
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 100))
+        items = [{'id': i, 'name': f"{entity} {i}", 'date': '2021-11-19', 'comment': 'mock ' * 10}
+                 for i in range(offset, min(self.total_items, offset + limit))]
+        return 200, json.dumps({entity: items, 'stats': {'totalItems': self.total_items}}).encode()
+
+    async def _http1(self, first_line, reader, writer):
+        line = first_line
+        while (line):
+            method, path, _ = line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if (header in (b'\r\n', b'\n', b'')):
+                    break
+                key, value = header.decode('latin-1').split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+            if (int(headers.get('content-length', 0))):
+                await reader.readexactly(int(headers['content-length']))
+            await asyncio.sleep(self.latency_fn())
+            status, body = self.response(method, path)
+            writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n".encode() + body)
+            await writer.drain()
+            line = await reader.readline()
+
+    async def _http2(self, preface, reader, writer):
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False,
+                                                                           header_encoding='utf-8'))
+        conn.initiate_connection()
+        window_updated = asyncio.Event()
+        requests = {}
+        reset_streams = set()
+
+        def flush():
+            writer.write(conn.data_to_send())
+
+        async def respond(stream_id, method, path):
+            await asyncio.sleep(self.latency_fn())
+            if (stream_id in reset_streams):
+                return  # the client cancelled the request
+            status, body = self.response(method, path)
+            conn.send_headers(stream_id, [(':status', str(status)), ('content-type', 'application/json'),
+                                          ('content-length', str(len(body)))])
+            while (body):
+                size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(body))
+                if (stream_id in reset_streams):
+                    return
+                if (size <= 0):
+                    window_updated.clear()
+                    await window_updated.wait()
+                    continue
+                conn.send_data(stream_id, body[:size])
+                body = body[size:]
+                flush()
+            conn.end_stream(stream_id)
+            flush()
+
+        data = preface
+        while (data):
+            for event in conn.receive_data(data):
+                if (isinstance(event, h2.events.RequestReceived)):
+                    headers = dict(event.headers)
+                    requests[event.stream_id] = (headers[':method'], headers[':path'])
+                elif (isinstance(event, h2.events.DataReceived)):
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif (isinstance(event, h2.events.StreamEnded)):
+                    asyncio.ensure_future(respond(event.stream_id, *requests.pop(event.stream_id)))
+                elif (isinstance(event, h2.events.WindowUpdated)):
+                    window_updated.set()
+                elif (isinstance(event, h2.events.StreamReset)):
+                    requests.pop(event.stream_id, None)
+                    reset_streams.add(event.stream_id)
+            flush()
+            await writer.drain()
+            data = await reader.read(65535)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            first_line = await reader.readline()
+            if (first_line.startswith(b'PRI')):
+                if (h2 is None):
+                    raise RuntimeError("HTTP/2 mock server requires h2 package")
+                await self._http2(first_line + await reader.readexactly(len(H2_PREFACE) - len(first_line)),
+                                  reader, writer)
+            else:
+                await self._http1(first_line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self):
+        """
+        Запускает сервер в отдельном потоке
+
+        Starts the server in a background thread
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, backlog=1024))
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            # connections still open are closed before the loop is closed
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def lognormal_latency(median=0.02, sigma=0.5, slow_share=0.0, slow_latency=0.5):
+    """
+    Возвращает функцию задержки: логнормальное распределение и доля очень медленных ответов
+
+    Returns latency function: log-normal distribution plus a share of very slow responses
+    """
+    def latency():
+        if (random.random() < slow_share):
+            return slow_latency
+        return random.lognormvariate(0, sigma) * median
+    return latency
@@ -0,0 +1,85 @@
+# coding=utf-8
+"""
+Замер построения датафрейма с развернутыми вложенными объектами ( data_load( normalize=True ) ) на синтетических
+ занятиях с записями учеников ( как в ответах API ) и с дополнительными вложенными объектами. Сравниваются
+ pd.json_normalize, _normalize из moyclass.py и _normalize по страницам в пуле процессов. "parent cpu" -
+ процессорное время основного процесса, последовательная часть, которую не ускоряет число ядер: у пула она
+ не меньше, чем у _normalize в одном процессе, так как страницы нужно передать в процессы и получить обратно.
+
+Measures building of the dataframe with flattened nested objects ( data_load( normalize=True ) ) on synthetic
+ lessons with records ( as in API responses ) and with extra nested objects. pd.json_normalize, _normalize of
+ moyclass.py and _normalize of pages in a process pool are compared. "parent cpu" is processor time of the main
+ process, the serial part which more cores don't speed up: for the pool it is not lower than for _normalize in one
+ process, since pages have to be sent to the processes and back.
+
+    python benchmarks/normalize_benchmark.py --lessons 60000 --workers 4
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from moyclass import _normalize  # noqa: E402
+
+
+def make_lessons(lessons_num, nested=False, seed=0):
+    rnd = random.Random(seed)
+    lessons = []
+    for i in range(lessons_num):
+        records = [{'id': i * 10 + j, 'userId': rnd.randint(1, 5000), 'lessonId': i, 'visit': rnd.random() < 0.8,
+                    'goodReason': False, 'free': False, 'bill': {'price': 500.0, 'paid': True}}
+                   for j in range(rnd.randint(0, 10))]
+        lesson = {'id': i, 'date': f"2021-10-{i % 28 + 1:02d}", 'beginTime': '10:00', 'endTime': '11:30',
+                  'classId': rnd.randint(1, 300), 'filialId': rnd.randint(1, 5), 'status': 1,
+                  'topic': f"Topic {i}", 'comment': None, 'teacherIds': [rnd.randint(1, 40)], 'records': records}
+        if (nested):
+            lesson['room'] = {'id': rnd.randint(1, 20), 'name': 'Room', 'capacity': 12}
+            lesson['class'] = {'id': rnd.randint(1, 300), 'name': 'Class', 'course': {'id': 7, 'name': 'Course'}}
+        lessons.append(lesson)
+    return lessons
+
+
+def measure(build, repeat):
+    """
+    :return: ( dataframe, best seconds, best processor seconds of this process )
+    """
+    seconds, cpu = [], []
+    for _ in range(repeat):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        df = build()
+        seconds.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - cpu_start)
+    return df, min(seconds), min(cpu)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lessons', type=int, default=60000)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.lessons} lessons, {args.page_size} per page, {os.cpu_count()} cores")
+    print(f"{'lessons':<14}{'method':<18}{'seconds':>10}{'parent cpu':>12}{'same result':>13}")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for name, nested in (('with records', False), ('+ nested', True)):
+            lessons = make_lessons(args.lessons, nested)
+            pages = [lessons[i:i + args.page_size] for i in range(0, len(lessons), args.page_size)]
+            methods = [('pd.json_normalize', lambda: pd.json_normalize(lessons)),
+                       ('_normalize', lambda: _normalize(lessons)),
+                       (f"pool of {args.workers}",
+                        lambda: pd.concat(list(pool.map(_normalize, pages)), ignore_index=True))]
+            expected = None
+            for method, build in methods:
+                df, seconds, cpu = measure(build, args.repeat)
+                expected = df if expected is None else expected
+                print(f"{name:<14}{method:<18}{seconds:>10.2f}{cpu:>12.2f}{str(df.equals(expected)):>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ This is example use of MoyClass library.
 """
 
 from moyclass import MoyClassCompanyAPI
+from moyclass_risk import RiskScoringEngine, RiskContext, RecentAttendanceRule, lesson_records_frame
 import credentials
 import pandas as pd
 pd.set_option('display.max_columns', None)
@@ -27,81 +28,33 @@ def badUsersSearch(api : MoyClassCompanyAPI, load_new_data = True):
     """
 
     # Get all users as dataframe and turn them into dictionary {uId: {'name': 'Oleg', 'clientStateId': 179}}
-    user_df = api.data_load(api.get_users, 'users', load_new_data=load_new_data)
+    user_df = api.data_load(api.get_users, 'users', load_new_data=load_new_data, fields=['id', 'name', 'filials'])
     user_data_dict = user_df[['name', 'filials', 'id']].set_index('id').to_dict(orient='index')
 
     # Get joins where user status is 'Учится' ('statusId': 2)
     params = [['statusId', '2']]
     joins_df = api.data_load(api.get_joins, 'joins', params=params, load_new_data=load_new_data)
-    user_good_groups = joins_df[['userId', 'classId']].groupby('userId')
-    for userId in user_data_dict:
-        user_data_dict[userId]['StudyGroups'] = []
-        if userId in user_good_groups.groups:
-            user_data_dict[userId]['StudyGroups'] = user_good_groups.get_group(userId)['classId'].values
 
     # Get last month (last 31 days) lessons with lesson records:
     from_date = datetime.today().date() - timedelta(days=31)
     to_date = datetime.today().date()
     params = [['date', f"{from_date}"], ['date', f"{to_date}"], ['includeRecords', 'true']]
-    lessons_with_records_df = api.data_load(api.get_lessons, 'lessons', params=params, load_new_data=load_new_data)
-
-    drop_cols = ['beginTime', 'endTime', 'createdAt', 'filialId', 'roomId', 'comment', 'maxStudents',
-                 'topic', 'description', 'teacherIds', 'status']
-    lessons_with_records_df = lessons_with_records_df.drop(drop_cols, axis=1)
+    lessons_with_records_df = api.data_load(api.get_lessons, 'lessons', params=params, load_new_data=load_new_data,
+                                            fields=['id', 'classId', 'date', 'records'])
 
     branches = api.get_company_branches()
     branches_df = pd.DataFrame(branches)
     branches_id = branches_df[['name', 'id']].set_index('id').to_dict(orient='index')
 
-    # user_visits structure:
-    # {userId: {classId: [['date', 'visit_status']]}}
-
-    user_visits = {}
-    for index, row in lessons_with_records_df.iterrows():
-        classId = row['classId']
-        date = row['date']
-        record = row['records']
-        if (len(record)):
-            # if(type(record)==str):
-            #     record = record.replace("\'", "\"")
-            #     record = record.replace("True", "\"True\"")
-            #     record = record.replace("False", "\"False\"")
-            #     record = record.replace("None", "\"None\"")
-            #     record = json.loads(record)
-            for el in record:
-                userId = el['userId']
-                lessonId = el['lessonId']
-                if(classId not in user_data_dict[userId]['StudyGroups']):
-                    continue
-                if(type(el['visit']) == bool and el['visit'] == True):
-                    visit = 1
-                # elif(type(el['visit']) == str and el['visit'] == "True"):
-                #     visit = 1
-                else:
-                    visit = 0
-                if (userId in user_visits.keys()):
-                    if (classId in user_visits[userId].keys()):
-                        user_visits[userId][classId].append([date, visit])
-                    else:
-                        user_visits[userId][classId] = [[date, visit]]
-                else:
-                    user_visits[userId] = {classId: [[date, visit]]}
+    # Only records in groups where the user studies are checked, users without such records are not scored
+    context = RiskContext(lesson_records_frame(lessons_with_records_df), memberships=joins_df[['userId', 'classId']],
+                          as_of=to_date)
+    engine = RiskScoringEngine([RecentAttendanceRule(window_days=31, last_n=2)])
+    scores_df = engine.score(context)
 
     good_users = []
     bad_users = []
-    for userId in user_visits.keys():
-        isBad = True
-        for classId in user_visits[userId]:
-            dates_visits = user_visits[userId][classId]
-            dates_visits.sort(key=lambda el: datetime.strptime(el[0], "%Y-%m-%d"))
-            if (len(dates_visits) == 1):
-                if (dates_visits[-1][1] == 1):
-                    isBad = False
-            elif (len(dates_visits) > 1):
-                if (dates_visits[-1][1] == 1 or dates_visits[-2][1] == 1):
-                    isBad = False
-        user_visits[userId]['isBad'] = isBad
-
+    for userId, isBad in scores_df['at_risk'].items():
         filials = [branches_id[fid]['name'] for fid in user_data_dict[userId]['filials']]
         if (isBad == True):
             bad_users.append([userId, user_data_dict[userId]['name'], filials])
@@ -3,8 +3,1182 @@ import os
 import math
 import requests
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import pickle as pkl
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import asyncio
+import threading
+import functools
+import contextlib
+import hashlib
+import tempfile
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from moyclass_diff import snapshot_diff
+from moyclass_cache import MemoryCache, atomic_pickle
+
+try:
+    import brotli  # responses in "br" encoding are decoded by urllib3 if brotli is installed
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import httpx  # optional HTTP/2 transport ( pip install httpx[http2] )
+except ImportError:
+    httpx = None
+
+
+def _nested_columns(df):
+    """
+    Возвращает названия столбцов, в которых есть вложенные объекты ( словари ), их разворачивает pd.json_normalize
+
+    Returns names of columns with nested objects ( dictionaries ), the ones pd.json_normalize flattens
+    """
+    return [col for col in df.columns[df.dtypes == object] if any(type(value) is dict for value in df[col].values)]
+
+
+def _normalize(items):
+    """
+    То же, что pd.json_normalize( items ), но на Python обходятся только столбцы с вложенными словарями,
+     остальные столбцы ( в том числе списки records занятий ) строит pd.DataFrame
+
+    Same as pd.json_normalize( items ), but only columns with nested dictionaries are walked in Python, other
+     columns ( lists of lesson records as well ) are built by pd.DataFrame
+    """
+    df = pd.DataFrame(items)
+    nested = _nested_columns(df)
+    if (not nested):
+        return df
+    # NaN means the entity has no such field, so it gets no flattened columns, as in pd.json_normalize
+    rows = [{col: value for col, value in zip(nested, values) if not (type(value) is float and value != value)}
+            for values in zip(*(df[col].tolist() for col in nested))]
+    flat = pd.json_normalize(rows)
+    flat.index = df.index
+    # as in pd.json_normalize, flattened columns go after the plain ones
+    return pd.concat([df.drop(columns=nested), flat], axis=1)
+
+
+class PageSizeTuner:
+    """
+    Подбирает размер страницы ( параметр "limit" ) для каждого типа запроса. На первых страницах загрузки
+     измеряется скорость ( объектов в секунду ) и размер ответа, лучший размер сохраняется в json файл и
+     используется при следующих запусках.
+
+    Chooses page size ( "limit" param ) per endpoint. Early pages of a load measure throughput ( items per second )
+     and payload size, the best size is saved to a json file and used as a starting point in later runs.
+    """
+
+    def __init__(self, path='saved_data/page_sizes.json', default_size=100, min_size=20, max_size=500,
+                 max_page_bytes=5 * 1024 * 1024, explore_pages=5):
+        """
+        :param path: json file with learned page sizes
+        :param default_size: page size used for endpoints without learned value
+        :param min_size: minimal page size
+        :param max_size: maximal page size accepted by the server
+        :param max_page_bytes: pages bigger than this size in bytes are not tried
+        :param explore_pages: number of first pages used to try different page sizes
+        """
+        self.path = path
+        self.default_size = default_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_page_bytes = max_page_bytes
+        self.explore_pages = explore_pages
+        self.learned = {}
+        self._runs = {}
+        # loads of different entities ( fetch_financials ) share one tuner from several threads
+        self._lock = threading.Lock()
+        if (os.path.exists(path)):
+            with open(path, encoding='utf-8') as f:
+                self.learned = json.load(f)
+
+    @staticmethod
+    def endpoint_key(entity_name, params=None):
+        """
+        Ключ типа запроса: название сущности и включенные include* параметры, так как они сильно меняют размер ответа
+
+        Endpoint key: entity name plus enabled include* params, since they change response size a lot
+        """
+        flags = sorted(str(param[0]) for param in (params or [])
+                       if str(param[0]).startswith(('include', 'append')) and str(param[1]).lower() == 'true')
+        return "+".join([entity_name] + flags)
+
+    def start(self, key):
+        with self._lock:
+            learned = self.learned.get(key, {})
+            self._runs[key] = {'start': learned.get('page_size', self.default_size), 'samples': {}, 'pages': 0,
+                               'max_size': self.max_size, 'bytes_per_item': learned.get('bytes_per_item')}
+
+    def _clamp(self, size, run):
+        max_size = run['max_size']
+        if (run['bytes_per_item']):
+            max_size = min(max_size, int(self.max_page_bytes / run['bytes_per_item']))
+        return int(max(self.min_size, min(size, max_size)))
+
+    def next_size(self, key):
+        """
+        Возвращает размер следующей страницы
+
+        Returns size of the next page
+        """
+        with self._lock:
+            return self._next_size(self._runs[key])
+
+    def _next_size(self, run):
+        samples = run['samples']
+        if (not samples):
+            return self._clamp(run['start'], run)
+        best = max(samples, key=samples.get)
+        if (run['pages'] >= self.explore_pages):
+            return best
+        # hill climbing: try doubling the best size while it helps, otherwise try halving it
+        for candidate in (self._clamp(best * 2, run), self._clamp(best // 2, run)):
+            if (candidate not in samples):
+                return candidate
+        return best
+
+    def record(self, key, size, items_num, seconds, bytes_num=None):
+        """
+        Сохраняет измерение для страницы
+
+        Records measurement for a page
+
+        :param size: requested page size
+        :param items_num: number of items received ( 0 if the server rejected the page size )
+        :param seconds: request time
+        :param bytes_num: response size in bytes ( None if unknown )
+        """
+        with self._lock:
+            run = self._runs[key]
+            run['pages'] += 1
+            if (items_num == 0):
+                run['max_size'] = max(self.min_size, size // 2)
+                run['samples'].pop(size, None)
+                return
+            if (bytes_num):
+                run['bytes_per_item'] = bytes_num / items_num
+            # the last page is usually incomplete and tells nothing about the page size
+            if (items_num >= size):
+                run['samples'][size] = items_num / max(seconds, 1e-6)
+
+    def finish(self, key):
+        """
+        Сохраняет лучший размер страницы в файл
+
+        Saves the best page size to the file
+        """
+        with self._lock:
+            run = self._runs.pop(key, None)
+            if (run is None or not run['samples']):
+                return
+            best = max(run['samples'], key=run['samples'].get)
+            self.learned[key] = {'page_size': best, 'items_per_second': round(run['samples'][best], 2),
+                                 'bytes_per_item': run['bytes_per_item']}
+            state = json.dumps(self.learned, indent=2)
+            folder = os.path.dirname(self.path) or '.'
+            if (not os.path.exists(folder)):
+                os.makedirs(folder, exist_ok=True)
+            # the file is replaced as a whole, so a reader never sees it half written
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(state)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if (os.path.exists(tmp_path)):
+                    os.remove(tmp_path)
+                raise
+
+
+class PageJournal:
+    """
+    Журнал загруженных страниц. Каждая страница сохраняется в отдельный json файл сразу после загрузки,
+     поэтому прерванную загрузку можно продолжить, не загружая готовые страницы заново.
+     Журнал привязан к параметрам загрузки ( signature ): если они изменились, старые страницы удаляются.
+
+    Journal of loaded pages. Every page is saved to its own json file right after it is loaded, so an interrupted
+     load can be resumed without loading completed pages again. The journal is bound to the load parameters
+     ( signature ): if they change, old pages are removed.
+    """
+
+    def __init__(self, folder, signature):
+        """
+        :param folder: folder of the journal
+        :param signature: json serializable description of the load ( entity name, params, page size )
+        """
+        self.folder = folder
+        self.signature = json.loads(json.dumps(signature, default=str))
+        manifest_path = os.path.join(folder, 'manifest.json')
+        manifest = None
+        if (os.path.exists(manifest_path)):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        if (manifest is not None and manifest.get('signature') != self.signature):
+            self.clear()
+        if (not os.path.exists(folder)):
+            os.makedirs(folder)
+        if (manifest is None or manifest.get('signature') != self.signature):
+            self._write_json(manifest_path, {'signature': self.signature})
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _page_path(self, offset):
+        return os.path.join(self.folder, f"{int(offset):010d}.json")
+
+    def offsets(self):
+        """
+        Возвращает отсортированный список смещений сохраненных страниц
+
+        Returns sorted list of offsets of saved pages
+        """
+        return sorted(int(name[:-5]) for name in os.listdir(self.folder)
+                      if name.endswith('.json') and name[:-5].isdigit())
+
+    def done(self, offset):
+        return os.path.exists(self._page_path(offset))
+
+    def write(self, offset, items, total=None):
+        """
+        Сохраняет страницу
+
+        Saves the page
+
+        :param offset: offset of the page
+        :param items: list of entities of the page
+        :param total: totalItems reported by the server
+        """
+        self._write_json(self._page_path(offset), {'offset': int(offset), 'total': total, 'items': items})
+
+    def read(self, offset):
+        with open(self._page_path(offset), encoding='utf-8') as f:
+            return json.load(f)
+
+    def pages(self):
+        """
+        Генератор сохраненных страниц в порядке смещений
+
+        Generator of saved pages in order of offsets
+        """
+        for offset in self.offsets():
+            yield self.read(offset)
+
+    def clear(self):
+        """
+        Удаляет журнал
+
+        Removes the journal
+        """
+        if (os.path.exists(self.folder)):
+            for name in os.listdir(self.folder):
+                os.remove(os.path.join(self.folder, name))
+            os.rmdir(self.folder)
+
+
+def endpoint_name(url):
+    """
+    Возвращает путь запроса, в котором id заменены на {id}: ".../v1/company/users/15" -> "/v1/company/users/{id}"
+
+    Returns request path with ids replaced by {id}: ".../v1/company/users/15" -> "/v1/company/users/{id}"
+    """
+    path = urlsplit(url).path
+    return "/".join("{id}" if part.isdigit() else part for part in path.split("/"))
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов ( token bucket ). Потокобезопасный, поддерживает ожидание в asyncio.
+
+    Requests rate limiter ( token bucket ). Thread-safe, supports waiting in asyncio.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: requests per second
+        :param burst: maximal number of requests sent at once ( rate by default )
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # tokens may go below zero: every caller reserves its slot and waits for it
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        wait = self._reserve()
+        if (wait > 0):
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Берет разрешение на запрос без ожидания
+
+        Takes a request permit without waiting
+
+        :return: True if the permit was taken, False if the limit is reached
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if (self.tokens < 1):
+                return False
+            self.tokens -= 1
+            return True
+
+    def idle(self):
+        """
+        Возвращает True, если корзина полная: ограничитель не помнит ни одного недавнего запроса
+
+        Returns True if the bucket is full: the limiter remembers no recent request
+        """
+        with self._lock:
+            return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+    def release(self):
+        """
+        Возвращает неиспользованное разрешение
+
+        Returns an unused permit
+        """
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if (wait > 0):
+            await asyncio.sleep(wait)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Запрос не отправлен: предохранитель точки доступа разомкнут
+
+    Request was not sent: circuit breaker of the endpoint is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для каждой точки доступа API. Если среди последних window запросов к точке доступа доля
+     ошибок ( ошибки соединения, таймауты, ответы 429 / 5xx ) или медленных ответов превышает порог,
+     предохранитель размыкается и запросы к ней reset_timeout секунд не отправляются. Затем отправляется один
+     пробный запрос: при успехе предохранитель замыкается, при ошибке снова размыкается.
+
+    Per-endpoint circuit breaker. If among the last window requests to the endpoint the share of errors
+     ( connection errors, timeouts, 429 / 5xx responses ) or slow responses exceeds the threshold, the breaker
+     opens and requests to the endpoint are not sent for reset_timeout seconds. Then one probe request is sent:
+     on success the breaker closes, on error it opens again.
+
+    States: 'closed' - requests are sent, 'open' - requests fail fast, 'half_open' - the probe request is sent.
+    """
+
+    def __init__(self, error_rate=0.5, slow_seconds=None, slow_rate=0.5, window=20, min_requests=10,
+                 reset_timeout=30):
+        """
+        :param error_rate: share of failed requests which opens the breaker
+        :param slow_seconds: responses slower than this are slow ( None - latency is not checked )
+        :param slow_rate: share of slow responses which opens the breaker
+        :param window: number of last requests of the endpoint taken into account
+        :param min_requests: the breaker doesn't open until the endpoint has at least this many requests
+        :param reset_timeout: seconds the breaker stays open before the probe request
+        """
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint):
+        if (endpoint not in self._endpoints):
+            self._endpoints[endpoint] = {'state': 'closed', 'results': deque(maxlen=self.window), 'opened_at': None,
+                                         'probe': False, 'trips': 0, 'rejected': 0}
+        return self._endpoints[endpoint]
+
+    def _open(self, info):
+        info['state'] = 'open'
+        info['opened_at'] = time.monotonic()
+        info['trips'] += 1
+        info['results'].clear()
+
+    def allow(self, endpoint):
+        """
+        Проверяет, можно ли отправить запрос к точке доступа
+
+        Checks whether a request to the endpoint can be sent
+        """
+        with self._lock:
+            info = self._endpoint(endpoint)
+            if (info['state'] == 'open' and time.monotonic() - info['opened_at'] >= self.reset_timeout):
+                info['state'] = 'half_open'
+                info['probe'] = False
+            if (info['state'] == 'closed'):
+                return True
+            if (info['state'] == 'half_open' and not info['probe']):
+                info['probe'] = True
+                return True
+            info['rejected'] += 1
+            return False
+
+    def record(self, endpoint, failed, seconds=None):
+        """
+        Учитывает результат запроса
+
+        Records result of the request
+
+        :param failed: True if the request failed
+        :param seconds: duration of the request
+        :return: state of the endpoint after the request
+        """
+        slow = self.slow_seconds is not None and seconds is not None and seconds > self.slow_seconds
+        with self._lock:
+            info = self._endpoint(endpoint)
+            if (info['state'] == 'half_open' and info['probe']):
+                if (failed or slow):
+                    self._open(info)
+                else:
+                    info['state'] = 'closed'
+                info['probe'] = False
+            elif (info['state'] == 'closed'):
+                info['results'].append((failed, slow))
+                requests_num = len(info['results'])
+                if (requests_num >= self.min_requests):
+                    errors = sum(result[0] for result in info['results'])
+                    slows = sum(result[1] for result in info['results'])
+                    if (errors >= self.error_rate * requests_num or
+                            (self.slow_seconds is not None and slows >= self.slow_rate * requests_num)):
+                        self._open(info)
+            # results of requests sent before the breaker opened don't change an open breaker
+            return info['state']
+
+    def state(self, endpoint):
+        with self._lock:
+            return self._endpoint(endpoint)['state']
+
+    def health(self):
+        """
+        Возвращает состояние точек доступа
+
+        Returns health of endpoints
+
+        :return: dataframe indexed by endpoint with state, requests, error_rate, slow_rate, trips, rejected columns
+        """
+        rows = {}
+        with self._lock:
+            for endpoint, info in self._endpoints.items():
+                results = info['results']
+                rows[endpoint] = {'state': info['state'], 'requests': len(results),
+                                  'error_rate': sum(result[0] for result in results) / len(results) if results else 0.0,
+                                  'slow_rate': sum(result[1] for result in results) / len(results) if results else 0.0,
+                                  'trips': info['trips'], 'rejected': info['rejected']}
+        report = pd.DataFrame.from_dict(rows, orient='index',
+                                        columns=['state', 'requests', 'error_rate', 'slow_rate', 'trips', 'rejected'])
+        report.index.name = 'endpoint'
+        return report
+
+
+class Hedger:
+    """
+    Дублирование медленных GET запросов ( hedged requests ). Если ответ не получен за время, в которое
+     укладывается quantile ответов этой точки доступа ( p95 по умолчанию ), отправляется копия запроса и
+     используется ответ, пришедший первым. Число копий ограничено долей budget от всех запросов, копия
+     отправляется, только если ограничения частоты запросов позволяют это без ожидания.
+
+    Hedging of slow GET requests. If there is no response within the time quantile of the endpoint responses
+     fit into ( p95 by default ), a copy of the request is sent and the first response is used. Number of copies
+     is limited by budget share of all requests, and a copy is sent only if the rate limits allow it without
+     waiting.
+
+    Example:
+        api = MoyClassCompanyAPI(api_key, transport=MoyClassTransport(hedging=Hedger(quantile=0.95, budget=0.05)))
+    """
+
+    def __init__(self, quantile=0.95, budget=0.05, window=200, min_samples=20, min_delay=0.005, workers=64):
+        """
+        :param quantile: quantile of the endpoint latency after which the copy is sent
+        :param budget: maximal share of extra requests
+        :param window: number of last responses of the endpoint the quantile is computed from
+        :param min_samples: requests are not hedged until the endpoint has this many responses
+        :param min_delay: minimal delay of the copy in seconds
+        :param workers: number of threads sending requests and their copies
+        """
+        self.quantile = quantile
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.workers = workers
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, seconds):
+        with self._lock:
+            if (endpoint not in self._latencies):
+                self._latencies[endpoint] = deque(maxlen=self.window)
+            self._latencies[endpoint].append(seconds)
+
+    def begin(self, endpoint):
+        """
+        Учитывает новый запрос и возвращает задержку, после которой отправляется копия ( None - без копии )
+
+        Counts a new request and returns the delay after which the copy is sent ( None - no copy )
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            latencies = self._latencies.get(endpoint)
+            if (latencies is None or len(latencies) < self.min_samples):
+                return None
+            latencies = sorted(latencies)
+            return max(self.min_delay, latencies[min(len(latencies) - 1, int(len(latencies) * self.quantile))])
+
+    def allow(self):
+        """
+        Проверяет бюджет и учитывает копию запроса
+
+        Checks the budget and counts a request copy
+        """
+        with self._lock:
+            if (self.stats['hedged'] + 1 > self.budget * self.stats['requests']):
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.stats['hedge_wins'] += 1
+
+
+def copy_json(data):
+    """
+    Быстрое копирование JSON объекта ( словари, списки и скаляры )
+
+    Fast copy of a JSON object ( dictionaries, lists and scalars )
+    """
+    if (type(data) == dict):
+        return {key: copy_json(value) for key, value in data.items()}
+    if (type(data) == list):
+        return [copy_json(value) for value in data]
+    return data
+
+
+class ConditionalCache:
+    """
+    Кэш GET ответов для условных запросов. Для каждого запроса хранятся валидаторы ETag / Last-Modified,
+     хэш тела ответа и разобранный JSON. Транспорт отправляет If-None-Match / If-Modified-Since и на ответ 304
+     возвращает данные из кэша. Если сервер не присылает валидаторы, ответ загружается полностью, но при совпадении
+     хэша тела повторный разбор JSON не выполняется.
+
+    Cache of GET responses for conditional requests. For every request ETag / Last-Modified validators, hash of
+     the response body and parsed JSON are stored. The transport sends If-None-Match / If-Modified-Since and serves
+     304 responses from the cache. If the server sends no validators, the response is downloaded in full, but
+     JSON is not parsed again when the body hash matches.
+
+    Entries are kept in storage: MemoryCache ( by default ) or TieredCache to share them between processes
+     ( see moyclass_cache.py ). Entries younger than max_age seconds are returned without any request, and
+     a response is requested by one thread / process at a time, so others wait and reuse it.
+
+    Example:
+        transport = MoyClassTransport(cache=ConditionalCache(storage=TieredCache(), max_age=60))
+        api = MoyClassCompanyAPI(api_key, transport=transport)
+    """
+
+    def __init__(self, max_entries=1024, storage=None, max_age=None, max_bytes=64 * 1024 * 1024):
+        """
+        :param max_entries: maximal number of cached responses in the default MemoryCache storage
+        :param storage: MemoryCache or TieredCache object ( to bound its memory use create its MemoryCache with
+         sizeof=ConditionalCache.entry_size )
+        :param max_age: entries younger than this many seconds are used without revalidation ( None - always
+         revalidate )
+        :param max_bytes: maximal total size of response bodies in the default MemoryCache storage
+         ( None - not limited )
+        """
+        self.storage = (storage if storage is not None else
+                        MemoryCache(max_entries, max_bytes=max_bytes, sizeof=self.entry_size))
+        self.max_age = max_age
+        self.stats = {'fresh': 0, 'not_modified': 0, 'unchanged': 0, 'miss': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(entry):
+        # size of the response body, parsed JSON takes a few times more memory, but grows with it
+        return entry['bytes']
+
+    @staticmethod
+    def key(url, params=None, token=None):
+        if (isinstance(params, dict)):
+            params = list(params.items())
+        # the token is hashed, so it is not stored in the shared cache as is
+        token = hashlib.blake2b(str(token).encode('utf-8'), digest_size=8).hexdigest()
+        return json.dumps([url, [list(param) for param in (params or [])], token], default=str)
+
+    def get(self, key, shared=False):
+        """
+        :param shared: if True the entry is read from the storage shared between processes ( if there is one )
+        """
+        if (shared and hasattr(self.storage, 'get_shared')):
+            return self.storage.get_shared(key)
+        return self.storage.get(key)
+
+    def lock(self, key):
+        return self.storage.lock(key)
+
+    def fresh(self, entry):
+        """
+        Возвращает копию данных записи, если она моложе max_age, иначе None
+
+        Returns copy of the entry data if it is younger than max_age, None otherwise
+        """
+        if (entry is None or self.max_age is None or time.time() - entry['stored_at'] > self.max_age):
+            return None
+        with self._lock:
+            self.stats['fresh'] += 1
+        return copy_json(entry['data'])
+
+    @staticmethod
+    def conditional_headers(entry, headers=None):
+        """
+        Добавляет к заголовкам запроса валидаторы из записи кэша
+
+        Adds validators of the cache entry to the request headers
+        """
+        headers = dict(headers or {})
+        if (entry.get('etag')):
+            headers['If-None-Match'] = entry['etag']
+        if (entry.get('last_modified')):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def resolve(self, key, entry, r):
+        """
+        Возвращает JSON ответа с учетом кэша и обновляет кэш
+
+        Returns JSON of the response using the cache and updates the cache
+
+        :param entry: cache entry used for the request ( None if there was no entry )
+        :param r: requests.Response
+        :return: ( JSON, cache result: 'not_modified', 'unchanged' or 'miss' )
+        """
+        if (r.status_code == 304 and entry is not None):
+            result, data = 'not_modified', entry['data']
+            entry = dict(entry, stored_at=time.time())
+        else:
+            digest = hashlib.blake2b(r.content, digest_size=16).hexdigest()
+            if (entry is not None and entry['hash'] == digest):
+                result, data = 'unchanged', entry['data']
+            else:
+                result, data = 'miss', r.json()
+            entry = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified'),
+                     'hash': digest, 'bytes': len(r.content), 'data': data, 'stored_at': time.time()}
+        self.storage.set(key, entry)
+        with self._lock:
+            self.stats[result] += 1
+        # callers may change the returned objects, so the cached copy is never returned
+        return copy_json(data), result
+
+
+class MoyClassTransport:
+    """
+    Общее транспортное ядро для MoyClassCompanyAPI и MoyClassUserAPI: пул соединений, повторы запросов,
+     ограничение частоты запросов для каждого токена и хуки для инструментирования.
+     Один транспорт можно использовать в нескольких клиентах, чтобы они делили пул соединений.
+
+    Shared transport core of MoyClassCompanyAPI and MoyClassUserAPI: connection pooling, retries, per-token
+     rate limits and instrumentation hooks. One transport can be shared by many clients, so they share
+     the connection pool.
+
+    Hooks are functions called as hook(event) after every request, where event is a dictionary:
+        { "method": "GET", "url": ..., "endpoint": "/v1/company/users/{id}", "status": 200, "seconds": 0.2,
+          "bytes": 1024, "wire_bytes": 180, "cache": None, "error": None, "breaker": "closed" }
+     "bytes" is the size of the decompressed response, "wire_bytes" - the size transferred over the network,
+     "cache" - result of ConditionalCache lookup ( 'not_modified', 'unchanged', 'miss', 'stale' or None ),
+     "breaker" - state of the endpoint circuit breaker after the request ( None without breaker ).
+     Requests rejected by an open breaker are reported with CircuitOpenError in "error".
+    """
+
+    MAX_LIMITERS = 4096  # number of per-token rate limiters kept in memory, idle ones above it are dropped
+
+    def __init__(self, pool_size=20, retries=3, backoff_factor=0.5, rate_limit=None, global_rate_limit=None,
+                 compression=True, cache=None, timeout=(10, 60), breaker=None, hedging=None):
+        """
+        :param pool_size: maximal number of pooled connections
+        :param retries: number of retries of idempotent requests ( GET, HEAD, OPTIONS, PUT, DELETE ) after
+         connection errors
+         and 429 / 5xx responses
+        :param backoff_factor: retries wait backoff_factor * 2 ^ ( retry number - 1 ) seconds
+        :param rate_limit: maximal number of requests per second for one token ( None - no limit )
+        :param global_rate_limit: maximal number of requests per second for all tokens together ( None - no limit )
+        :param compression: if True gzip / deflate ( and brotli, if brotli package is installed ) responses are
+         requested, otherwise responses are requested uncompressed
+        :param cache: ConditionalCache object. If passed, GET requests are revalidated with ETag / Last-Modified
+        :param timeout: seconds to wait for the server: ( connect timeout, read timeout ) or one number for both
+         ( None - wait forever )
+        :param breaker: CircuitBreaker object. If passed, requests to failing or slow endpoints fail fast with
+         CircuitOpenError, GET requests with a cached response get the cached data instead
+        :param hedging: Hedger object. If passed, slow GET requests are duplicated and the first response is used
+        """
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.rate_limit = rate_limit
+        self.global_limiter = RateLimiter(global_rate_limit) if global_rate_limit else None
+        self.hooks = []
+        self.cache = cache
+        self.timeout = timeout
+        self.breaker = breaker
+        self.hedging = hedging
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        encodings = (['br'] if brotli is not None else []) + ['gzip', 'deflate']
+        self.session.headers['Accept-Encoding'] = ", ".join(encodings) if compression else 'identity'
+        self.payload_stats = {}
+        self._stats_lock = threading.Lock()
+        self._limiters = OrderedDict()
+        self._limiters_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = None
+        self._hedge_executor = None
+
+    @property
+    def last_response_bytes(self):
+        """
+        Размер последнего ответа в байтах ( для текущего потока )
+
+        Size of the last response in bytes ( for the current thread )
+        """
+        return getattr(self._local, 'last_response_bytes', None)
+
+    @property
+    def last_status(self):
+        """
+        HTTP статус последнего ответа ( для текущего потока, None - ответа не было )
+
+        HTTP status of the last response ( for the current thread, None if there was no response )
+        """
+        return getattr(self._local, 'last_status', None)
+
+    def limiter(self, token):
+        if (not self.rate_limit):
+            return None
+        with self._limiters_lock:
+            if (token not in self._limiters):
+                self._limiters[token] = RateLimiter(self.rate_limit)
+                # one limiter per student token. Only limiters with a full bucket are dropped, a new limiter for
+                #  the token starts with a full bucket too, so this changes nothing. While the least recently used
+                #  limiter still remembers requests, more than MAX_LIMITERS limiters are kept
+                while (len(self._limiters) > self.MAX_LIMITERS and next(iter(self._limiters.values())).idle()):
+                    self._limiters.popitem(last=False)
+            self._limiters.move_to_end(token)
+            return self._limiters[token]
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            hook(event)
+
+    @contextlib.contextmanager
+    def extra_headers(self, headers):
+        """
+        Добавляет заголовки ко всем запросам, отправленным в текущем потоке внутри блока with
+
+        Adds headers to all requests sent by the current thread inside the with block
+
+        Example:
+            with api.transport.extra_headers({'Idempotency-Key': key}):
+                api.create_payment(payment_info)
+        """
+        previous = getattr(self._local, 'extra_headers', None)
+        self._local.extra_headers = dict(previous or {}, **headers)
+        try:
+            yield
+        finally:
+            self._local.extra_headers = previous
+
+    @staticmethod
+    def _read_body(r, chunk_size=64 * 1024):
+        """
+        Читает тело ответа по частям, распаковывая его по мере чтения
+
+        Reads response body chunk by chunk, decompressing it while reading
+
+        :return: ( decompressed size, size transferred over the network ) in bytes
+        """
+        body = bytearray()
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            body += chunk
+        r._content = bytes(body)
+        wire_bytes = r.raw.tell() if hasattr(r.raw, 'tell') else len(body)
+        return len(body), wire_bytes
+
+    def _send(self, method, url, headers=None, json=None, params=None):
+        """
+        Отправляет запрос через пул соединений requests
+
+        Sends the request through the requests connection pool
+
+        :return: ( requests.Response with loaded body, size transferred over the network in bytes )
+        """
+        r = self.session.request(
+            method=method,
+            url=url,
+            json=json,
+            headers=headers,
+            params=params,
+            stream=True,
+            timeout=self.timeout,
+        )
+        return r, self._read_body(r)[1]
+
+    def _hedge_permit(self, token):
+        """
+        Проверяет ограничения частоты и бюджет копий без ожидания: копия не должна превышать лимит запросов
+
+        Checks rate limits and the copies budget without waiting: a copy must not exceed the requests limit
+        """
+        taken = []
+        for limiter in (self.limiter(token), self.global_limiter):
+            if (limiter is None):
+                continue
+            if (not limiter.try_acquire()):
+                break
+            taken.append(limiter)
+        else:
+            if (self.hedging.allow()):
+                return True
+        for limiter in taken:
+            limiter.release()
+        return False
+
+    def _hedged_send(self, method, url, headers=None, json=None, params=None, token=None):
+        """
+        Отправляет запрос и, если он выполняется дольше обычного, его копию ( см. Hedger )
+
+        Sends the request and, if it takes longer than usual, its copy ( see Hedger )
+
+        :param token: access token of the request, the copy is counted in its rate limit
+        :return: the first successful result of _send
+        """
+        endpoint = endpoint_name(url)
+        delay = self.hedging.begin(endpoint)
+        with self._stats_lock:
+            if (self._hedge_executor is None):
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.hedging.workers)
+
+        started = []
+        first_started = threading.Event()
+
+        def attempt():
+            start = time.perf_counter()
+            started.append(start)
+            first_started.set()
+            result = self._send(method, url, headers=headers, json=json, params=params)
+            self.hedging.observe(endpoint, time.perf_counter() - start)
+            return result
+
+        if (delay is None):
+            return attempt()
+        futures = [self._hedge_executor.submit(attempt)]
+        # the delay is counted from the actual start of the request, time spent in the executor queue is excluded
+        first_started.wait()
+        done, _ = wait(futures, timeout=max(0.0, delay - (time.perf_counter() - started[0])))
+        if (not done and self._hedge_permit(token)):
+            futures.append(self._hedge_executor.submit(attempt))
+        # the slower attempt can't be cancelled, it finishes in the background and its response is dropped
+        pending = set(futures)
+        while (pending):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if (future.exception() is None):
+                    if (future is not futures[0]):
+                        self.hedging.won()
+                    return future.result()
+        return futures[0].result()
+
+    def _account(self, event):
+        with self._stats_lock:
+            stats = self.payload_stats.setdefault(event['endpoint'], {'requests': 0, 'compressed_bytes': 0,
+                                                                      'decompressed_bytes': 0})
+            stats['requests'] += 1
+            stats['compressed_bytes'] += event['wire_bytes']
+            stats['decompressed_bytes'] += event['bytes']
+
+    def payload_report(self):
+        """
+        Возвращает объем переданных данных по типам запросов: в сжатом виде ( по сети ) и после распаковки
+
+        Returns transferred data volume per endpoint: compressed ( over the network ) and decompressed
+
+        :return: dataframe indexed by endpoint with requests, compressed_bytes, decompressed_bytes, ratio columns
+        """
+        with self._stats_lock:
+            report = pd.DataFrame.from_dict(self.payload_stats, orient='index',
+                                            columns=['requests', 'compressed_bytes', 'decompressed_bytes'])
+        report.index.name = 'endpoint'
+        report['ratio'] = report['compressed_bytes'] / report['decompressed_bytes'].where(
+            report['decompressed_bytes'] > 0)
+        return report.sort_values('compressed_bytes', ascending=False)
+
+    def request(self, method, url, headers=None, json=None, params=None, void=False, token=None, limited=True):
+        """
+        Отправляет запрос и возвращает ответ сервера в формате JSON ( None, если void=True )
+
+        Sends the request and returns server response as JSON ( None if void=True )
+
+        :param token: access token the request is sent with ( used for rate limiting )
+        :param limited: if False the rate limit is not applied ( it was already applied by the caller )
+        """
+        if (self.cache is None or method.upper() != 'GET' or void):
+            return self._request(method, url, headers, json, params, void, token, limited)
+        cache_key = self.cache.key(url, params, token)
+        data = self.cache.fresh(self.cache.get(cache_key))
+        if (data is not None):
+            return data
+        # one thread / process requests the data, others wait and reuse its response
+        with self.cache.lock(cache_key):
+            cache_entry = self.cache.get(cache_key, shared=True)
+            data = self.cache.fresh(cache_entry)
+            if (data is not None):
+                return data
+            return self._request(method, url, headers, json, params, void, token, limited, cache_key, cache_entry)
+
+    def _rejected(self, method, url, void=False, cache_entry=None):
+        """
+        Обрабатывает запрос, не отправленный из-за разомкнутого предохранителя: возвращает сохраненный в кэше ответ
+         или вызывает CircuitOpenError
+
+        Handles a request not sent because of an open circuit breaker: returns the cached response or raises
+         CircuitOpenError
+        """
+        endpoint = endpoint_name(url)
+        event = {'method': method, 'url': url, 'endpoint': endpoint, 'status': None, 'seconds': 0.0,
+                 'bytes': None, 'wire_bytes': None, 'cache': None,
+                 'error': CircuitOpenError(f"Circuit breaker of {endpoint} is open"), 'breaker': 'open'}
+        if (cache_entry is not None):
+            event['cache'] = 'stale'
+            self._emit(event)
+            return None if void else copy_json(cache_entry['data'])
+        self._emit(event)
+        raise event['error']
+
+    def _request(self, method, url, headers=None, json=None, params=None, void=False, token=None, limited=True,
+                 cache_key=None, cache_entry=None, conditional=True):
+        if (self.breaker is not None and not self.breaker.allow(endpoint_name(url))):
+            return self._rejected(method, url, void, cache_entry)
+        if (limited):
+            for limiter in (self.limiter(token), self.global_limiter):
+                if (limiter is not None):
+                    limiter.acquire()
+        self._local.last_response_bytes = self._local.last_status = None
+        event = {'method': method, 'url': url, 'endpoint': endpoint_name(url), 'status': None, 'seconds': None,
+                 'bytes': None, 'wire_bytes': None, 'cache': None, 'error': None, 'breaker': None}
+        if (cache_entry is not None):
+            headers = self.cache.conditional_headers(cache_entry, headers)
+        extra_headers = getattr(self._local, 'extra_headers', None)
+        if (extra_headers):
+            headers = dict(headers or {}, **extra_headers)
+        if (not conditional):
+            headers = {name: value for name, value in (headers or {}).items()
+                       if name.lower() not in ('if-none-match', 'if-modified-since')}
+        start = time.perf_counter()
+        r = None
+        try:
+            send = (functools.partial(self._hedged_send, token=token)
+                    if (self.hedging is not None and method.upper() == 'GET') else self._send)
+            try:
+                r, event['wire_bytes'] = send(method, url, headers=headers, json=json, params=params)
+                self._local.last_status = event['status'] = r.status_code
+            finally:
+                # health is recorded before the body is parsed, so a half-open probe is always resolved
+                self._record(event, time.perf_counter() - start)
+            self._local.last_response_bytes = event['bytes'] = len(r.content)
+            self._account(event)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as errh:
+            event['error'] = errh
+            print("Http Error:", errh)
+            error_data = self._error_body(r)
+            if (isinstance(error_data, dict) and 'code' in error_data):
+                print(f"Server error message: {error_data['code']}")
+            print(error_data)
+        except requests.exceptions.RequestException as err:
+            event['error'] = err
+            event['seconds'] = time.perf_counter() - start
+            if (isinstance(err, requests.exceptions.ConnectionError)):
+                print("Error Connecting:", err)
+            elif (isinstance(err, requests.exceptions.Timeout)):
+                print("Timeout Error:", err)
+            else:
+                print("OOps: Something Else", err)
+            self._emit(event)
+            raise
+        if (r.status_code == 304 and cache_entry is None and conditional and not void):
+            # the validators were sent, but there is nothing cached to serve ( the entry was evicted or the
+            #  validators came with the caller headers ), so the full response is requested without them
+            event['seconds'] = time.perf_counter() - start
+            self._emit(event)
+            return self._request(method, url, headers, json, params, void, token, limited, cache_key, None,
+                                 conditional=False)
+        data = None
+        if (cache_key is not None and (r.ok or (r.status_code == 304 and cache_entry is not None))):
+            data, event['cache'] = self.cache.resolve(cache_key, cache_entry, r)
+            if (r.status_code == 304):
+                self._local.last_response_bytes = cache_entry['bytes']
+        elif (not void and r.status_code != 304):
+            # error pages of gateways ( 502 html ) are not JSON, such responses are returned as None
+            data = r.json() if event['error'] is None else self._error_body(r)
+            if (type(data) == str):
+                data = None
+        event['seconds'] = time.perf_counter() - start
+        self._emit(event)
+        if not void:
+            return data
+
+    @staticmethod
+    def _error_body(r):
+        """
+        Возвращает тело ответа с ошибкой: JSON, если он есть, иначе начало текста
+
+        Returns body of the error response: JSON if there is one, beginning of the text otherwise
+        """
+        try:
+            return r.json()
+        except ValueError:
+            return r.text[:500]
+
+    def _record(self, event, seconds):
+        # client errors ( 4xx ) say nothing about endpoint health
+        if (self.breaker is not None):
+            status = event['status']
+            failed = status is None or status == 429 or status >= 500
+            event['breaker'] = self.breaker.record(event['endpoint'], failed, seconds)
+
+    async def request_async(self, method, url, headers=None, json=None, params=None, void=False, token=None):
+        """
+        Асинхронная версия request. Ожидание лимита происходит в цикле событий, а запрос выполняется в пуле потоков
+         поверх общего пула соединений.
+
+        Async version of request. Rate limit waiting happens in the event loop and the request runs in a thread
+         pool over the shared connection pool.
+        """
+        for limiter in (self.limiter(token), self.global_limiter):
+            if (limiter is not None):
+                await limiter.acquire_async()
+        if (self._executor is None):
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(
+            self.request, method, url, headers=headers, json=json, params=params, void=void, token=token,
+            limited=False))
+
+    def close(self):
+        self.session.close()
+        if (self._executor is not None):
+            self._executor.shutdown(wait=False)
+        if (self._hedge_executor is not None):
+            self._hedge_executor.shutdown(wait=False)
+
+
+class MoyClassHttp2Transport(MoyClassTransport):
+    """
+    Транспорт HTTP/2 на основе httpx ( pip install httpx[http2] ). Параллельные запросы ( страницы в
+     MoyClassTenantPool, moyclass_cli, plan_load ) мультиплексируются через несколько соединений вместо
+     отдельного соединения HTTP/1.1 на каждый запрос. Ограничения частоты, хуки и статистика те же,
+     что у MoyClassTransport.
+
+    HTTP/2 transport based on httpx ( pip install httpx[http2] ). Concurrent requests ( pages in
+     MoyClassTenantPool, moyclass_cli, plan_load ) are multiplexed over a few connections instead of one
+     HTTP/1.1 connection per request. Rate limits, hooks and statistics are the same as in MoyClassTransport.
+
+    Example:
+        api = MoyClassCompanyAPI(api_key, transport=MoyClassHttp2Transport(max_connections=2))
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, max_connections=4, prior_knowledge=False, **kwargs):
+        """
+        :param max_connections: maximal number of connections, every connection carries many concurrent requests
+        :param prior_knowledge: if True HTTP/2 is used without negotiation ( needed for http:// servers,
+         e.g. local mock servers )
+        :param kwargs: MoyClassTransport params
+        """
+        if (httpx is None):
+            raise ImportError("HTTP/2 transport requires httpx ( pip install httpx[http2] )")
+        super().__init__(**kwargs)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # retries of the httpx transport cover connection errors, 429 / 5xx responses are retried in _send
+        self.client = httpx.Client(
+            transport=httpx.HTTPTransport(http1=not prior_knowledge, http2=True, limits=limits, retries=self.retries),
+            headers={'Accept-Encoding': self.session.headers['Accept-Encoding']}, timeout=self._httpx_timeout())
+
+    def _httpx_timeout(self):
+        if (isinstance(self.timeout, (tuple, list))):
+            connect, read = self.timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(self.timeout)
+
+    def _send(self, method, url, headers=None, json=None, params=None):
+        """
+        Отправляет запрос через httpx и возвращает ответ в виде requests.Response, чтобы обработка ответов
+         не зависела от транспорта
+
+        Sends the request through httpx and returns the response as requests.Response, so response handling
+         doesn't depend on the transport
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.client.stream(method, url, json=json, headers=headers, params=params) as response:
+                    body = bytearray()
+                    for chunk in response.iter_bytes(chunk_size=64 * 1024):
+                        body += chunk
+                    wire_bytes = response.num_bytes_downloaded
+            except httpx.TimeoutException as err:
+                raise requests.exceptions.Timeout(err)
+            except httpx.TransportError as err:
+                raise requests.exceptions.ConnectionError(err)
+            if (response.status_code not in self.RETRY_STATUSES or method.upper() not in self.RETRY_METHODS
+                    or attempt == self.retries):
+                break
+            time.sleep(self.backoff_factor * 2 ** attempt)
+        r = requests.Response()
+        r.status_code = response.status_code
+        r.reason = response.reason_phrase
+        r.url = str(response.url)
+        r.headers = requests.structures.CaseInsensitiveDict(response.headers)
+        r._content = bytes(body)
+        r.encoding = response.encoding
+        return r, wire_bytes
+
+    def close(self):
+        self.client.close()
+        super().close()
 
 
 class MoyClassCompanyAPI:
@@ -13,14 +1187,52 @@ class MoyClassCompanyAPI:
     For contacts: vitalkrat@gmail.com
     """
 
-    def __init__(self, api_key):
+    DEFAULT_PAGE_SIZE = 100  # default number of entities in one page ( "limit" param )
+
+    def __init__(self, api_key, transport=None, lazy_auth=False):
+        """
+        :param api_key: your access key
+        :param transport: MoyClassTransport object. Pass the same transport to several clients to share
+         the connection pool ( a new transport is created by default )
+        :param lazy_auth: if True the token is obtained on the first request instead of here
+        """
 
         self.api_key = api_key  # your access key
         self.print_Flag = True
-        self.token = self._get_token()
+        self.transport = transport if transport is not None else MoyClassTransport()
+        self.page_size_tuner = PageSizeTuner(default_size=self.DEFAULT_PAGE_SIZE)
+        self._token = None
+        self._token_lock = threading.Lock()
+        if (not lazy_auth):
+            self.token = self._get_token()
 
-    @staticmethod
-    def data_load(method, entity_name, params=None, load_new_data=True):
+    @property
+    def token(self):
+        """
+        Токен доступа. Если он еще не получен, выполняется авторизация
+
+        Access token. Authorization is done if the token was not obtained yet
+        """
+        if (self._token is None):
+            with self._token_lock:
+                if (self._token is None):
+                    self._token = self._get_token()
+        return self._token
+
+    @token.setter
+    def token(self, value):
+        self._token = value
+
+    @property
+    def last_response_bytes(self):
+        return self.transport.last_response_bytes
+
+    @property
+    def last_status(self):
+        return self.transport.last_status
+
+    def data_load(self, method, entity_name, params=None, load_new_data=True, store=None, change_feed=None,
+                  auto_page_size=True, checkpoint=False, window_days=None, fields=None, normalize=False):
         """
         Функция загружает объекты данных и передает их во датафрейм. Датафрейм затем сохраняется как pickle файл и
           может быть загружен в следующий раз, когда вы запустите код
@@ -45,50 +1257,357 @@ class MoyClassCompanyAPI:
         :param params: list of query parameters ( options can be seen on https://api.moyklass.com/ for each entity_name)
         :param load_new_data: if True loads data from the server. Otherwise tries to find corresponding pickle
          file in 'saved_data' folder
+        :param store: MoyClassStore object. If passed, loaded data is also synced into the local store
+         ( see moyclass_store.py ), so later queries can run locally
+        :param change_feed: ChangeFeed object. If passed, new data is compared with the previously saved pickle
+         file and row-level changes are published to the feed ( see moyclass_diff.py )
+        :param auto_page_size: if True and params don't contain 'limit', page size is chosen by
+         self.page_size_tuner ( see PageSizeTuner )
+        :param checkpoint: if True every loaded page is saved to 'saved_data/journal' folder ( see PageJournal ).
+         If the load fails, the next call with the same params loads only missing pages. The dataframe is built
+         only when the pages are verified against totalItems
+        :param window_days: with checkpoint=True the date range in params ( e.g. [['date', '2021-01-01'],
+         ['date', '2021-12-31']] ) is split into windows of this many days, loaded and checkpointed one by one
+        :param fields: list of fields to keep ( e.g. ['id', 'classId', 'date', 'records'] ). Other fields are
+         dropped from every page as soon as it is received, so they never reach the dataframe. Projected data is
+         saved to its own pickle file ( the full '{entity_name}_df.pkl' file stays untouched ) and can't be
+         passed to store or change_feed
+        :param normalize: if True nested objects are flattened into columns, as with pd.json_normalize. Only
+         columns with nested objects are walked in Python, lists ( e.g. lesson records ) are kept as they are
+         ( see benchmarks/normalize_benchmark.py )
 
         :return: dataframe with data
         """
+        if (fields is not None and (store is not None or change_feed is not None)):
+            raise ValueError("store and change_feed need full entities, they can't be used with fields")
         if (not os.path.exists('saved_data')):
             os.mkdir('saved_data')
-        data_path = f"saved_data/{entity_name}_df.pkl"
-        if (os.path.exists(data_path) and load_new_data == False):
-            with open(data_path, 'rb') as f:
+        full_data_path = data_path = f"saved_data/{entity_name}_df.pkl"
+        if (fields is not None):
+            fields_hash = hashlib.blake2b(",".join(fields).encode('utf-8'), digest_size=4).hexdigest()
+            data_path = f"saved_data/{entity_name}_{fields_hash}_df.pkl"
+        if (load_new_data == False and (os.path.exists(data_path) or os.path.exists(full_data_path))):
+            with open(data_path if os.path.exists(data_path) else full_data_path, 'rb') as f:
                 df = pkl.load(f)
+            if (fields is not None):
+                df = df[[field for field in fields if field in df.columns]]
             print(f"{entity_name}_df is loaded from file")
         else:
-            page_entities_num = 100  # default value
-
-            # add limit parameter in case it's not in the params
-            if (params != None):
-                has_limit = False
-                for param in params:
-                    if (param[0] == 'limit'):
-                        page_entities_num = param[1]
-                        has_limit = True
-                if (not has_limit):
-                    params.append(['limit', page_entities_num])
+            start = datetime.now()
+            if (checkpoint):
+                full_list, paged = self._checkpointed_load(method, entity_name, params, auto_page_size,
+                                                           window_days, fields=fields)
             else:
-                params = [['limit', page_entities_num]]
-
-            first_response = method(params)
-            if (type(first_response) == dict):
-                items_num = first_response['stats']['totalItems']
-                print(f"Number of {entity_name} with requested params: {items_num}")
-                pages_num = math.ceil(items_num / page_entities_num)
-                start = datetime.now()
-                full_list = []
-                for i in range(pages_num):
-                    full_list += method(params + [['offset', f'{page_entities_num * i}']])[entity_name]
-                df = pd.DataFrame(full_list)
+                full_list, paged = None, True
+                for page in self.iter_pages(method, entity_name, params, auto_page_size=auto_page_size,
+                                            fields=fields):
+                    if (type(page) != dict):
+                        print(entity_name)
+                        full_list, paged = page, False
+                        break
+                    if (full_list is None):
+                        print(f"Number of {entity_name} with requested params: {page['stats']['totalItems']}")
+                        full_list = []
+                    full_list += page[entity_name]
+            df = _normalize(full_list) if (normalize and paged) else pd.DataFrame(full_list)
+            if (paged):
                 print(
                     f"{entity_name[0].upper()}{entity_name[1:]} data loaded in {(datetime.now() - start).seconds} seconds ")
-            else:
-                print(entity_name)
-                df = pd.DataFrame(first_response)
-            with open(data_path, 'wb') as f:
-                pkl.dump(df, f)
+            if (change_feed is not None and os.path.exists(data_path) and 'id' in df.columns):
+                with open(data_path, 'rb') as f:
+                    old_df = pkl.load(f)
+                change_feed.publish(entity_name, snapshot_diff(old_df, df))
+            atomic_pickle(data_path, df)
+        if (store is not None):
+            store.sync(entity_name, df)
         return df
 
+    def iter_pages(self, method, entity_name, params=None, auto_page_size=True, offset=0, fields=None):
+        """
+        Загружает объекты постранично и возвращает страницы по одной ( генератор ), не храня все данные в памяти
+
+        Loads entities page by page and yields pages one at a time ( generator ) without keeping all data in memory
+
+        :param method: request function, see data_load
+        :param entity_name: name of the data returned, see data_load
+        :param params: list of query parameters
+        :param auto_page_size: if True and params don't contain 'limit', page size is chosen by self.page_size_tuner
+        :param offset: number of entities to skip ( used to resume an interrupted load )
+        :param fields: list of fields to keep in every entity ( None - all fields )
+        :return: generator of pages in the format returned by method:
+            { "entity_name": [ {...}, {...}], "stats": { "totalItems": 5 } }, ...
+         Responses in the list format ( [ {...} ] ) are yielded once as they are.
+        """
+        params = [list(param) for param in (params or [])]
+        page_entities_num = None
+        for param in params:
+            if (param[0] == 'limit'):
+                page_entities_num = int(param[1])
+        params = [param for param in params if param[0] not in ('limit', 'offset')]
+        tuner = self.page_size_tuner if (auto_page_size and page_entities_num is None) else None
+
+        if (tuner is not None):
+            key = tuner.endpoint_key(entity_name, params)
+            tuner.start(key)
+            page_entities_num = tuner.next_size(key)
+        elif (page_entities_num is None):
+            page_entities_num = self.DEFAULT_PAGE_SIZE
+
+        try:
+            first_params = params + [['limit', page_entities_num]] + ([['offset', f'{offset}']] if offset else [])
+            first_response, seconds, bytes_num = self._timed_call(method, first_params)
+            if (type(first_response) != dict):
+                yield self._project(first_response, fields)
+                return
+            first_response[entity_name] = self._project(first_response[entity_name], fields)
+            items_num = first_response['stats']['totalItems']
+            loaded = offset + len(first_response[entity_name])
+            if (tuner is not None):
+                tuner.record(key, page_entities_num, len(first_response[entity_name]), seconds, bytes_num)
+            yield first_response
+            while (loaded < items_num):
+                if (tuner is not None):
+                    page_entities_num = tuner.next_size(key)
+                page, seconds, bytes_num = self._timed_call(
+                    method, params + [['limit', page_entities_num], ['offset', f'{loaded}']])
+                if (type(page) != dict or entity_name not in page):
+                    if (tuner is not None and page_entities_num > tuner.min_size
+                            and self._limit_rejected(method, page)):
+                        # page size was rejected, try again with a smaller one
+                        tuner.record(key, page_entities_num, 0, seconds, bytes_num)
+                        continue
+                    raise ValueError(f"Page of {entity_name} with offset {loaded} was not loaded: {page}")
+                if (tuner is not None):
+                    tuner.record(key, page_entities_num, len(page[entity_name]), seconds, bytes_num)
+                if (not page[entity_name]):
+                    break  # entities were deleted during the load
+                loaded += len(page[entity_name])
+                page[entity_name] = self._project(page[entity_name], fields)
+                yield page
+        finally:
+            # the generator can be closed early or return the list format response
+            if (tuner is not None):
+                tuner.finish(key)
+
+    @staticmethod
+    def _project(items, fields):
+        """
+        Оставляет в каждом объекте только указанные поля
+
+        Keeps only the given fields in every entity
+        """
+        if (fields is None or type(items) != list):
+            return items
+        return [{field: item[field] for field in fields if field in item} for item in items]
+
+    @staticmethod
+    def _date_windows(params, window_days):
+        """
+        Разбивает диапазон дат в параметрах на окна по window_days дней
+
+        Splits date range of the params into windows of window_days days
+
+        :return: list of params, one for every window
+        """
+        if (not window_days):
+            return [params]
+        keys = [param[0] for param in params]
+        for key in dict.fromkeys(keys):
+            values = [param[1] for param in params if param[0] == key]
+            if (len(values) != 2):
+                continue
+            try:
+                date_from, date_to = sorted(datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+                                            for value in values)
+            except ValueError:
+                continue
+            other = [param for param in params if param[0] != key]
+            windows = []
+            while (date_from <= date_to):
+                window_end = min(date_to, date_from + timedelta(days=window_days - 1))
+                windows.append(other + [[key, f"{date_from}"], [key, f"{window_end}"]])
+                date_from = window_end + timedelta(days=1)
+            return windows
+        raise ValueError("window_days requires a date range in params, e.g. [['date', '2021-01-01'], "
+                         "['date', '2021-12-31']]")
+
+    @staticmethod
+    def _journal_chain(pages):
+        """
+        Собирает страницы журнала подряд начиная со смещения 0
+
+        Chains journal pages one after another starting from offset 0
+
+        :return: ( items, next offset, totalItems of the last chained page or None )
+        """
+        items, offset, total = [], 0, None
+        for page in pages:
+            if (page['offset'] < offset):
+                continue  # page of an older attempt overlapping the chain
+            if (page['offset'] > offset):
+                break
+            items += page['items']
+            offset += len(page['items'])
+            total = page['total']
+            if (not page['items']):
+                break
+        return items, offset, total
+
+    def _checkpointed_load(self, method, entity_name, params, auto_page_size=True, window_days=None,
+                           journal_folder='saved_data/journal', attempts=2, fields=None):
+        """
+        Загрузка с сохранением страниц в журнал ( см. data_load ). Окна и страницы, уже сохраненные в журнале,
+         повторно не загружаются. Окно считается загруженным, когда число объектов и уникальных id в нем совпадает
+         с totalItems, иначе окно загружается заново ( не более attempts раз ).
+
+        Load with pages saved to the journal ( see data_load ). Windows and pages already saved in the journal
+         are not loaded again. A window is complete when its number of entities and unique ids equal totalItems,
+         otherwise the window is loaded again ( at most attempts times ).
+
+        :return: ( list of entities, True ) or ( response, False ) for responses in the list format
+        """
+        params = [list(param) for param in (params or [])]
+        if (any(param[0] == 'limit' for param in params)):
+            auto_page_size = False
+        windows = self._date_windows([param for param in params if param[0] != 'offset'], window_days)
+        # loads of one entity with different params must not share journals
+        load_hash = hashlib.blake2b(json.dumps([params, window_days, fields], default=str).encode('utf-8'),
+                                    digest_size=6).hexdigest()
+        full_list, journals = [], []
+        for number, window_params in enumerate(windows):
+            signature = {'entity': entity_name, 'params': window_params, 'fields': fields}
+            journal = PageJournal(os.path.join(journal_folder, entity_name, f"{load_hash}_window_{number}"),
+                                  signature)
+            for attempt in range(attempts):
+                items, offset, total = self._journal_chain(journal.pages())
+                if (total is None or offset < total):
+                    if (self.print_Flag and offset):
+                        print(f"Resuming {entity_name} window {number + 1} of {len(windows)} from offset {offset}")
+                    for page in self.iter_pages(method, entity_name, window_params, auto_page_size, offset=offset,
+                                                fields=fields):
+                        if (type(page) != dict):
+                            journal.clear()
+                            return page, False
+                        journal.write(offset, page[entity_name], page['stats']['totalItems'])
+                        offset += len(page[entity_name])
+                    items, offset, total = self._journal_chain(journal.pages())
+                ids = [item.get('id') for item in items]
+                if (len(items) == total and (None in ids or len(set(ids)) == total)):
+                    break
+                if (self.print_Flag):
+                    print(f"{entity_name} window {number + 1} has {len(items)} entities instead of {total} "
+                          f"( data changed during the load ), loading it again")
+                journal.clear()
+                journal = PageJournal(journal.folder, signature)
+            else:
+                raise ValueError(f"{entity_name} window {window_params} could not be verified against totalItems")
+            full_list += items
+            journals.append(journal)
+        if (len(windows) > 1 and all('id' in item for item in full_list)):
+            # entities on the windows borders can be returned twice
+            full_list = list({item['id']: item for item in full_list}.values())
+        if (self.print_Flag):
+            print(f"Number of {entity_name} with requested params: {len(full_list)}")
+        # the dataset is complete, so the checkpoints are not needed anymore
+        for journal in journals:
+            journal.clear()
+        return full_list, True
+
+    @staticmethod
+    def _limit_rejected(method, response):
+        """
+        Проверяет, отклонил ли сервер размер страницы: ответ 400 с ошибкой о параметре limit. Другие ошибки
+         ( 401, 5xx после повторов ) не зависят от размера страницы
+
+        Checks if the server rejected the page size: a 400 response with an error about the limit param. Other
+         errors ( 401, 5xx after retries ) don't depend on the page size
+        """
+        status = getattr(getattr(method, '__self__', None), 'last_status', None)
+        if (response is None or status not in (None, 400, 422)):
+            return False
+        return 'limit' in json.dumps(response, ensure_ascii=False, default=str).lower()
+
+    @staticmethod
+    def _timed_call(method, params):
+        """
+        Вызывает функцию запроса и возвращает ( ответ, время в секундах, размер ответа в байтах или None )
+
+        Calls request function and returns ( response, seconds, response size in bytes or None )
+        """
+        client = getattr(method, '__self__', None)
+        start = time.perf_counter()
+        response = method(params)
+        seconds = time.perf_counter() - start
+        return response, seconds, getattr(client, 'last_response_bytes', None)
+
+    def plan_load(self, specs, rate_limit=None, jobs=1):
+        """
+        Планирует загрузку данных без ее выполнения. Для каждого запроса параллельно отправляется пробный запрос
+         с limit=1, по которому определяется количество объектов, страниц и запросов, которые сделает data_load.
+         Время загрузки оценивается по измеренной задержке запросов и ограничению частоты запросов.
+
+        Plans data loading without running it. For every spec a probe request with limit=1 is sent ( in parallel )
+         to find out number of items, pages and calls data_load will make. Wall-clock time is estimated from
+         measured request latency and the rate limit.
+
+        :param specs: list of ( method, entity_name, params ) tuples, the same arguments you'd pass to data_load
+            For example: [ (api.get_users, 'users', None),
+                           (api.get_lessons, 'lessons', [['date', '2021-10-01'], ['date', '2021-10-31']]) ]
+        :param rate_limit: maximum number of requests per second allowed by the server ( the rate limit of
+         self.transport by default )
+        :param jobs: number of requests that will be sent in parallel
+        :return: {
+                    "plan": dataframe with entity_name, total_items, page_size, pages, calls, latency columns,
+                    "total_items": int, "total_calls": int, "estimated_seconds": float
+                 }
+        """
+        def probe(spec):
+            method, entity_name, params = spec
+            params = [list(param) for param in (params or [])]
+            page_size = None
+            for param in params:
+                if (param[0] == 'limit'):
+                    page_size = int(param[1])
+            if (page_size is None):
+                key = self.page_size_tuner.endpoint_key(entity_name, params)
+                page_size = self.page_size_tuner.learned.get(key, {}).get('page_size', self.DEFAULT_PAGE_SIZE)
+            probe_params = [param for param in params if param[0] not in ('limit', 'offset')] + [['limit', 1]]
+            start = time.perf_counter()
+            response = method(probe_params)
+            latency = time.perf_counter() - start
+            if (type(response) == dict):
+                total_items = response['stats']['totalItems']
+                pages = max(1, math.ceil(total_items / page_size))
+                calls = pages
+            else:
+                total_items = len(response)
+                pages = calls = 1
+            return {'entity_name': entity_name, 'total_items': total_items, 'page_size': page_size,
+                    'pages': pages, 'calls': calls, 'latency': latency}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(specs), 8))) as executor:
+            plan_df = pd.DataFrame(list(executor.map(probe, specs)))
+
+        total_calls = int(plan_df['calls'].sum()) if len(plan_df) else 0
+        # every spec takes its own calls * latency, a plain mean latency underestimates loads with slow big specs
+        busy_seconds = float((plan_df['calls'] * plan_df['latency']).sum()) if len(plan_df) else 0.0
+        estimated_seconds = busy_seconds / max(1, jobs)
+        if (rate_limit is None):
+            # all calls are sent with one token, so both the per-token and the global limits apply
+            rates = [self.transport.rate_limit,
+                     self.transport.global_limiter.rate if (self.transport.global_limiter is not None) else None]
+            rate_limit = min([rate for rate in rates if rate], default=None)
+        if (rate_limit):
+            estimated_seconds = max(estimated_seconds, total_calls / rate_limit)
+        plan = {'plan': plan_df,
+                'total_items': int(plan_df['total_items'].sum()) if len(plan_df) else 0,
+                'total_calls': total_calls,
+                'estimated_seconds': estimated_seconds}
+        if (self.print_Flag):
+            print(f"Planned {plan['total_calls']} calls for {plan['total_items']} items, "
+                  f"estimated time {estimated_seconds:.1f} seconds")
+        return plan
+
     # General request function :
     def __request(self, method, url, headers="tokenOnlyMode", json=None, params=None, void=False):
         """
@@ -121,27 +1640,9 @@ class MoyClassCompanyAPI:
         elif(type(headers)==dict):
             headers["x-access-token"] = self.token
 
-        try:
-            r = requests.request(
-                method=method,
-                url=url,
-                json=json,
-                headers=headers,
-                params=params,
-            )
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as errh:
-            print("Http Error:", errh)
-            print(f"Server error message: {r.json()['code']}")
-            print(r.json())
-        except requests.exceptions.ConnectionError as errc:
-            print("Error Connecting:", errc)
-        except requests.exceptions.Timeout as errt:
-            print("Timeout Error:", errt)
-        except requests.exceptions.RequestException as err:
-            print("OOps: Something Else", err)
-        if not void:
-            return r.json()
+        # rate limit is applied per company ( api key ), so the token request is limited as well
+        return self.transport.request(method, url, headers=headers, json=json, params=params, void=void,
+                                      token=self.api_key)
 
     # Авторизация ( Authorization )
     def _get_token(self):
@@ -1985,12 +3486,45 @@ class MoyClassCompanyAPI:
         return self.__request(method = 'GET', url=url, params=params)
 
 class MoyClassUserAPI:
+    """
+    Клиент API личного кабинета ученика. Использует тот же транспорт ( MoyClassTransport ), что и MoyClassCompanyAPI,
+     поэтому клиенты могут делить пул соединений, а лимит частоты запросов считается для каждого токена отдельно.
+
+    Client of the user ( student ) account API. It uses the same transport ( MoyClassTransport ) as
+     MoyClassCompanyAPI, so clients can share the connection pool, and the rate limit is applied per token.
+    """
 
-    def __init__(self, api_key):
+    def __init__(self, token, api_key=None, transport=None):
+        """
+        :param token: user access token ( x-access-token )
+        :param api_key: access key, added to request body if given
+        :param transport: MoyClassTransport object ( a new transport is created by default )
+        """
 
-        self.api_key = api_key  # your access key
+        self.api_key = api_key
         self.print_Flag = True
-        self.token = self._get_token()
+        self.transport = transport if transport is not None else MoyClassTransport()
+        self.token = token
+
+    def _prepare(self, headers, json):
+        """
+        Готовит заголовки и тело запроса ( см. __request )
+
+        Prepares request headers and body ( see __request )
+        """
+        if (self.api_key is not None):
+            if json is None:
+                json = {"apiKey": self.api_key}
+            elif (type(json) == dict):
+                json["apiKey"] = self.api_key
+
+        if (headers == "getTokenMode"):
+            headers = None
+        elif (headers == "tokenOnlyMode"):
+            headers = {"x-access-token": self.token}
+        elif (type(headers) == dict):
+            headers["x-access-token"] = self.token
+        return headers, json
 
     # General request function :
     def __request(self, method, url, headers="tokenOnlyMode", json=None, params=None, void=False):
@@ -2004,47 +3538,28 @@ class MoyClassUserAPI:
             request headers should be empty in request for token ( "getTokenMode" value )
             request headers should be equal {"x-access-token":self.token} in most requests ( "tokenOnlyMode" value )
             request headers can be dictionary with parameters in this case token would be added to it ( dict type )
-        :param json: dict object. json is request body. It always includes api key and in some cases also request
-            details (for post requests mainly)
+        :param json: dict object. json is request body. It includes api key if it was given and in some cases also
+            request details (for post requests mainly)
         :param params: request parameters should be transferred as list of pairs or as dictionary.
             I recommend using list of pairs since first item in pair can be not unique for some requests.
             For example: params = [ ['name', 'John Doe'], ['date', '2020-01-01'], ['date', '2021-11-19'] ]
         :param void: bool value, equal False if we expect response from server and True if we don't expect response.
             default values False
         """
-        if json is None:
-            json = {"apiKey": self.api_key}
-        elif (type(json) == dict):
-            json["apiKey"] = self.api_key
+        headers, json = self._prepare(headers, json)
+        return self.transport.request(method, url, headers=headers, json=json, params=params, void=void,
+                                      token=self.token)
 
-        if (headers == "getTokenMode"):
-            headers = None
-        elif (headers == "tokenOnlyMode"):
-            headers = {"x-access-token": self.token}
-        elif (type(headers) == dict):
-            headers["x-access-token"] = self.token
+    def request(self, method, url, headers="tokenOnlyMode", json=None, params=None, void=False):
+        """
+        Отправляет запрос к API личного кабинета с токеном ученика ( см. __request )
 
-        try:
-            r = requests.request(
-                method=method,
-                url=url,
-                json=json,
-                headers=headers,
-                params=params,
-            )
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as errh:
-            print("Http Error:", errh)
-            print(f"Server error message: {r.json()['code']}")
-            print(r.json())
-        except requests.exceptions.ConnectionError as errc:
-            print("Error Connecting:", errc)
-        except requests.exceptions.Timeout as errt:
-            print("Timeout Error:", errt)
-        except requests.exceptions.RequestException as err:
-            print("OOps: Something Else", err)
-        if not void:
-            return r.json()
+        Sends a request to the user account API with the user token ( see __request )
+
+        Example:
+            lessons = api.request('GET', "https://api.moyklass.com/v1/user/lessons", params=[['limit', 100]])
+        """
+        return self.__request(method, url, headers=headers, json=json, params=params, void=void)
 
     # Авторизация ( Authorization )
 
@@ -2127,3 +3642,57 @@ class MoyClassUserAPI:
         self.__request(method='DELETE', url=url, void=True)
         if (self.print_Flag):
             print(" was deleted")
+
+
+def _sync_only(name):
+    def method(self, *args, **kwargs):
+        raise NotImplementedError(f"{name} is synchronous, use await api.request(...) of AsyncMoyClassUserAPI or "
+                                  f"MoyClassUserAPI.{name}")
+    method.__name__ = name
+    return method
+
+
+class AsyncMoyClassUserAPI(MoyClassUserAPI):
+    """
+    Асинхронная версия MoyClassUserAPI: запросы отправляются корутиной request, лимит частоты запросов ожидается
+     без блокировки цикла событий. Синхронные методы MoyClassUserAPI здесь недоступны.
+
+    Async version of MoyClassUserAPI: requests are sent with the request coroutine, the rate limit is awaited
+     without blocking the event loop. Synchronous methods of MoyClassUserAPI are not available here.
+
+    Example:
+        api = AsyncMoyClassUserAPI(token, transport=MoyClassTransport(rate_limit=5))
+        lessons = await api.request('GET', "https://api.moyklass.com/v1/user/lessons")
+    """
+
+    # General request function :
+    async def __request(self, method, url, headers="tokenOnlyMode", json=None, params=None, void=False):
+        """
+        Асинхронный шаблон запроса ( см. MoyClassUserAPI.__request )
+
+        Async request template ( see MoyClassUserAPI.__request )
+        """
+        headers, json = self._prepare(headers, json)
+        return await self.transport.request_async(method, url, headers=headers, json=json, params=params,
+                                                  void=void, token=self.token)
+
+    async def request(self, method, url, headers="tokenOnlyMode", json=None, params=None, void=False):
+        """
+        Асинхронно отправляет запрос к API личного кабинета с токеном ученика ( см. MoyClassUserAPI.request )
+
+        Sends a request to the user account API with the user token asynchronously ( see MoyClassUserAPI.request )
+        """
+        return await self.__request(method, url, headers=headers, json=json, params=params, void=void)
+
+    # inherited methods would send requests synchronously and block the event loop
+    get_ = _sync_only('get_')
+    create_ = _sync_only('create_')
+    get__info = _sync_only('get__info')
+    change_ = _sync_only('change_')
+    delete_ = _sync_only('delete_')
+
+
+if __name__ == '__main__':
+    # python -m moyclass export users lessons --since 2021-10-01 ( see moyclass_cli.py )
+    from moyclass_cli import main
+    main()
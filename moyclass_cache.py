@@ -0,0 +1,387 @@
+# coding=utf-8
+import os
+import time
+import sqlite3
+import tempfile
+import hashlib
+import threading
+import contextlib
+import pickle as pkl
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def _stripe(key, stripes):
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') % stripes
+
+
+def _flock(f):
+    if (fcntl is not None):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue  # LK_LOCK gives up after 10 seconds
+
+
+def _funlock(f):
+    if (fcntl is not None):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Эксклюзивная файловая блокировка между процессами ( файл path создается при необходимости )
+
+    Exclusive file lock across processes ( the path file is created if needed )
+    """
+    with open(path, 'a+b') as f:
+        _flock(f)
+        try:
+            yield
+        finally:
+            _funlock(f)
+
+
+class ReentrantFileLock:
+    """
+    Файловая блокировка между процессами, которую поток может взять повторно. Внутри процесса потоки
+     исключаются через RLock, а файл блокируется только при первом входе, так как повторный flock того же
+     файла из одного процесса блокирует сам процесс.
+
+    File lock across processes which a thread can take again. Threads of the process are excluded with
+     an RLock and the file is locked on the first entry only, since a second flock of the same file from one
+     process blocks the process itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if (self._depth == 0):
+                f = open(self.path, 'a+b')
+                try:
+                    _flock(f)
+                except BaseException:
+                    f.close()
+                    raise
+                self._file = f
+            self._depth += 1
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._depth -= 1
+            if (self._depth == 0):
+                try:
+                    _funlock(self._file)
+                finally:
+                    self._file.close()
+                    self._file = None
+        finally:
+            self._lock.release()
+
+
+def atomic_pickle(path, data):
+    """
+    Атомарно сохраняет объект в pickle файл: объект пишется во временный файл, который затем заменяет path.
+     Читатели всегда видят старый или новый файл целиком, параллельные писатели не портят файл.
+
+    Atomically saves the object to a pickle file: the object is written to a temporary file which then replaces
+     path. Readers always see the whole old or new file, concurrent writers don't corrupt it.
+    """
+    folder = os.path.dirname(path) or '.'
+    if (not os.path.exists(folder)):
+        os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pkl.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if (os.path.exists(tmp_path)):
+            os.remove(tmp_path)
+        raise
+
+
+class MemoryCache:
+    """
+    Кэш в памяти процесса с вытеснением давно не использованных записей ( LRU )
+
+    In-process cache with least recently used eviction ( LRU )
+    """
+
+    def __init__(self, max_entries=1024, lock_stripes=64, max_bytes=None, sizeof=None):
+        """
+        :param max_entries: maximal number of entries
+        :param lock_stripes: number of key locks, keys are spread over them by hash
+        :param max_bytes: maximal total size of entries ( None - not limited ), least recently used entries are
+         evicted first, an entry larger than max_bytes is not kept at all
+        :param sizeof: function returning size of the value in bytes ( required with max_bytes )
+        """
+        if (max_bytes is not None and sizeof is None):
+            raise ValueError("sizeof is required with max_bytes")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # reentrant, so a fetch holding one key can take another key of the same stripe
+        self._key_locks = [threading.RLock() for _ in range(lock_stripes)]
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if (item is None):
+                return None
+            value, expires, _ = item
+            if (expires is not None and expires < time.time()):
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, time.time() + ttl if ttl else None, size)
+            self.size += size
+            while (len(self._entries) > self.max_entries or
+                   (self.max_bytes is not None and self.size > self.max_bytes)):
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        item = self._entries.pop(key, None)
+        if (item is not None):
+            self.size -= item[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def lock(self, key):
+        """
+        Блокировка ключа внутри процесса. Число блокировок постоянно, разные ключи могут делить одну блокировку.
+         Блокировка повторно входимая: поток может взять ключ, делящий блокировку с уже взятым.
+
+        In-process lock of the key. Number of locks is fixed, different keys can share one lock. The lock is
+         reentrant: a thread can take a key sharing the lock with a key it already holds.
+        """
+        return self._key_locks[_stripe(key, len(self._key_locks))]
+
+
+class DiskCache:
+    """
+    Кэш на диске в базе SQLite, общий для всех процессов на одном сервере. Запись безопасна при параллельных
+     писателях ( транзакции SQLite в режиме WAL ), блокировка ключей между процессами выполняется через файловые
+     блокировки.
+
+    On-disk cache in SQLite database shared by all processes on one host. Writes are safe with concurrent writers
+     ( SQLite transactions in WAL mode ), keys are locked across processes with file locks.
+    """
+
+    def __init__(self, path='saved_data/cache.db', timeout=30, lock_stripes=256):
+        """
+        :param path: database file
+        :param timeout: seconds to wait for a locked database
+        :param lock_stripes: number of lock files, keys are spread over them by hash
+        """
+        self.path = path
+        self.timeout = timeout
+        self.lock_stripes = lock_stripes
+        self.locks_folder = path + '.locks'
+        folder = os.path.dirname(path)
+        if (folder and not os.path.exists(folder)):
+            os.makedirs(folder, exist_ok=True)
+        os.makedirs(self.locks_folder, exist_ok=True)
+        self._local = threading.local()
+        self._file_locks = [ReentrantFileLock(os.path.join(self.locks_folder, f"{stripe}.lock"))
+                            for stripe in range(lock_stripes)]
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if (conn is None):
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=self.timeout)
+        return conn
+
+    def get_entry(self, key):
+        """
+        :return: ( value, expiration time or None ) or None if there is no such key
+        """
+        row = self._connection().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if (row is None or (row[1] is not None and row[1] < time.time())):
+            return None
+        return pkl.loads(row[0]), row[1]
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl=None):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                         (key, pkl.dumps(value, protocol=pkl.HIGHEST_PROTOCOL), time.time() + ttl if ttl else None))
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def purge(self):
+        """
+        Удаляет просроченные записи
+
+        Removes expired entries
+        """
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+
+    def lock(self, key):
+        """
+        Блокировка ключа между процессами ( файловая блокировка ). Число файлов блокировок постоянно,
+         разные ключи могут делить один файл. Файл, уже заблокированный этим потоком, повторно не блокируется
+
+        Lock of the key across processes ( file lock ). Number of lock files is fixed, different keys can share
+         one file. A file already locked by this thread is not locked again ( see ReentrantFileLock )
+        """
+        return self._file_locks[_stripe(key, self.lock_stripes)]
+
+
+class TieredCache:
+    """
+    Двухуровневый кэш: LRU в памяти процесса и общий для процессов кэш на диске ( SQLite ).
+     get_or_fetch гарантирует, что параллельные потоки и процессы на одном сервере не загружают одни и те же
+     данные одновременно: первый загружает, остальные ждут и берут результат из кэша.
+
+    Two-tier cache: in-process LRU and on-disk cache ( SQLite ) shared by processes. get_or_fetch makes sure
+     concurrent threads and processes on one host don't fetch the same data at the same time: the first one
+     fetches, others wait and take the result from the cache.
+
+    Example:
+        cache = TieredCache()
+        classes = cache.get_or_fetch('classes', api.get_classes, ttl=3600)
+        # shared with the transport, so pages and reference tables are fetched once per host:
+        api = MoyClassCompanyAPI(api_key, transport=MoyClassTransport(cache=ConditionalCache(storage=cache)))
+    """
+
+    def __init__(self, memory=None, disk=None, path='saved_data/cache.db', max_entries=1024):
+        """
+        :param memory: MemoryCache object ( created with max_entries by default )
+        :param disk: DiskCache object ( created with path by default )
+        """
+        self.memory = memory if memory is not None else MemoryCache(max_entries)
+        self.disk = disk if disk is not None else DiskCache(path)
+        self.stats = {'memory': 0, 'disk': 0, 'miss': 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if (value is not None):
+            self.stats['memory'] += 1
+            return value
+        entry = self.disk.get_entry(key)
+        if (entry is not None):
+            self.stats['disk'] += 1
+            self._promote(key, *entry)
+            return entry[0]
+        self.stats['miss'] += 1
+        return None
+
+    def get_shared(self, key):
+        """
+        Читает значение из общего кэша на диске, минуя память процесса ( значение могло быть обновлено другим
+         процессом )
+
+        Reads value from the shared disk cache bypassing process memory ( the value could be updated by another
+         process )
+        """
+        entry = self.disk.get_entry(key)
+        if (entry is None):
+            return None
+        self._promote(key, *entry)
+        return entry[0]
+
+    def _promote(self, key, value, expires):
+        # the memory copy expires together with the disk one
+        self.memory.set(key, value, max(expires - time.time(), 1e-3) if expires is not None else None)
+
+    def set(self, key, value, ttl=None):
+        self.disk.set(key, value, ttl)
+        self.memory.set(key, value, ttl)
+
+    def delete(self, key):
+        self.disk.delete(key)
+        self.memory.delete(key)
+
+    def clear(self):
+        self.disk.clear()
+        self.memory.clear()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Блокировка ключа между потоками и процессами
+
+        Lock of the key across threads and processes
+        """
+        with self.memory.lock(key):
+            with self.disk.lock(key):
+                yield
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """
+        Возвращает значение из кэша или загружает его функцией fetch() ( один раз на сервер )
+
+        Returns value from the cache or fetches it with fetch() ( once per host )
+
+        :param key: string key
+        :param fetch: function without arguments returning the value
+        :param ttl: lifetime of the value in seconds ( None - no limit )
+        """
+        value = self.get(key)
+        if (value is not None):
+            return value
+        with self.lock(key):
+            # another thread or process could fetch the value while we were waiting for the lock
+            entry = self.disk.get_entry(key)
+            if (entry is not None):
+                self._promote(key, *entry)
+                return entry[0]
+            value = fetch()
+            self.set(key, value, ttl)
+            return value
@@ -0,0 +1,192 @@
+# coding=utf-8
+"""
+Командная строка для выгрузки данных ( command line export tool ).
+
+Examples:
+    python -m moyclass export users lessons --since 2021-10-01 --format parquet --jobs 8
+    python moyclass_cli.py export payments --since 2021-11-01 --until 2021-11-30 --format ndjson > payments.ndjson
+
+The api key is taken from --api-key or MOYCLASS_API_KEY environment variable. Every loaded page is saved
+ to the journal folder, so rerunning an interrupted export loads only missing pages.
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import contextlib
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from moyclass import MoyClassCompanyAPI, PageJournal
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# Название выгрузки : ( метод API, название списка в ответе, параметр даты для --since / --until )
+# Export name : ( API method, name of entities list in the response, date param used for --since / --until )
+ENTITIES = {
+    'users': ('get_users', 'users', 'createdAt'),
+    'joins': ('get_joins', 'joins', 'createdAt'),
+    'lessons': ('get_lessons', 'lessons', 'date'),
+    'lessonRecords': ('get_lesson_records', 'lessonRecords', 'date'),
+    'payments': ('get_payments', 'payments', 'date'),
+    'invoices': ('get_invoices', 'invoices', 'createdAt'),
+    'subscriptions': ('get_userSubscriptions', 'subscriptions', 'sellDate'),
+    'tasks': ('get_tasks', 'tasks', 'createdAt'),
+}
+
+
+def export_params(name, since=None, until=None, extra=()):
+    """
+    Возвращает параметры запроса для выгрузки
+
+    Returns query params of the export
+
+    :param extra: list of "key=value" strings
+    """
+    date_param = ENTITIES[name][2]
+    params = []
+    if (since or until):
+        # one date value is an exact date filter, so the range always gets both bounds
+        params += [[date_param, f"{since or '1970-01-01'}"], [date_param, f"{until or date.today().isoformat()}"]]
+    for pair in extra:
+        key, value = pair.split('=', 1)
+        params.append([key, value])
+    return params
+
+
+def export_pages(api, name, params, page_size=100, jobs=1, journal_folder='saved_data/export_journal', log=None,
+                 fields=None):
+    """
+    Загружает все страницы выгрузки параллельно ( jobs запросов одновременно ) и сохраняет каждую в журнал.
+     Уже сохраненные страницы не загружаются повторно.
+
+    Loads all pages of the export in parallel ( jobs requests at once ) and saves every page to the journal.
+     Already saved pages are not loaded again.
+
+    :param fields: list of fields to keep in every entity ( None - all fields )
+    :return: PageJournal object with all pages
+    """
+    method_name, entity_name, _ = ENTITIES[name]
+    method = getattr(api, method_name)
+    journal = PageJournal(os.path.join(journal_folder, name),
+                          {'entity': entity_name, 'params': params, 'page_size': page_size, 'fields': fields})
+
+    def load(offset):
+        page = method(params + [['limit', page_size], ['offset', f'{offset}']])
+        if (type(page) != dict or entity_name not in page):
+            raise ValueError(f"Page of {entity_name} with offset {offset} was not loaded: {page}")
+        journal.write(offset, api._project(page[entity_name], fields), page['stats']['totalItems'])
+        return page['stats']['totalItems']
+
+    total = journal.read(0)['total'] if journal.done(0) else load(0)
+    offsets = [offset for offset in range(page_size, total, page_size) if not journal.done(offset)]
+    if (log is not None):
+        log(f"{name}: {total} items, {len(offsets)} of {max(1, math.ceil(total / page_size))} pages to load")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        list(executor.map(load, offsets))
+    loaded = sum(len(page['items']) for page in journal.pages())
+    if (loaded != total and log is not None):
+        log(f"{name}: {loaded} items loaded, but server reported {total} ( data changed during the export )")
+    return journal
+
+
+def write_ndjson(journal, out, entity=None):
+    """
+    Пишет объекты по одному json на строку. Если указан entity, объект записывается как {"entity": ..., "item": ...}
+
+    Writes entities one json per line. If entity is given, the entity is written as {"entity": ..., "item": ...}
+    """
+    for page in journal.pages():
+        for item in page['items']:
+            if (entity is not None):
+                item = {'entity': entity, 'item': item}
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def write_parquet(journal, path):
+    items = []
+    for page in journal.pages():
+        items += page['items']
+    df = pd.DataFrame(items)
+    # nested objects ( records, filials, ... ) are stored as json strings
+    for col in df.columns[df.dtypes == object]:
+        if (df[col].map(lambda value: isinstance(value, (dict, list))).any()):
+            df[col] = df[col].map(lambda value: json.dumps(value, ensure_ascii=False)
+                                  if isinstance(value, (dict, list)) else value)
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return len(df)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='moyclass', description="MoyClass API tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="export entities to parquet files or NDJSON")
+    export.add_argument('entities', nargs='+', choices=sorted(ENTITIES), metavar='entity',
+                        help=f"entities to export: {', '.join(sorted(ENTITIES))}")
+    export.add_argument('--since', help="first date ( YYYY-MM-DD ) of the entity date filter")
+    export.add_argument('--until', help="last date ( YYYY-MM-DD ) of the entity date filter ( today by default )")
+    export.add_argument('--param', action='append', default=[], metavar='KEY=VALUE',
+                        help="additional query param, can be repeated")
+    export.add_argument('--fields', type=lambda value: value.split(','), default=None,
+                        help="comma separated list of fields to keep, e.g. id,userId,date")
+    export.add_argument('--format', choices=['parquet', 'ndjson'], default='ndjson')
+    export.add_argument('--output', default=None,
+                        help="output folder for parquet ( saved_data by default ) or file for ndjson ( stdout by "
+                             "default )")
+    export.add_argument('--jobs', type=int, default=4, help="number of parallel requests")
+    export.add_argument('--page-size', type=int, default=MoyClassCompanyAPI.DEFAULT_PAGE_SIZE)
+    export.add_argument('--journal', default='saved_data/export_journal', help="folder of page checkpoints")
+    export.add_argument('--keep-journal', action='store_true', help="don't remove checkpoints after the export")
+    export.add_argument('--api-key', default=os.environ.get('MOYCLASS_API_KEY'))
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if (not args.api_key):
+        sys.exit("moyclass: api key is required ( --api-key or MOYCLASS_API_KEY )")
+    if (args.format == 'parquet' and pyarrow is None):
+        sys.exit("moyclass: parquet format requires pyarrow ( pip install pyarrow )")
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    out = sys.stdout
+    output_file = None
+    if (args.format == 'ndjson' and args.output):
+        output_file = out = open(args.output, 'w', encoding='utf-8')
+    try:
+        # library messages go to stderr, so stdout contains only exported data
+        with contextlib.redirect_stdout(sys.stderr):
+            api = MoyClassCompanyAPI(args.api_key, lazy_auth=True)
+            api.print_Flag = False
+            for name in args.entities:
+                params = export_params(name, args.since, args.until, args.param)
+                journal = export_pages(api, name, params, page_size=args.page_size, jobs=args.jobs,
+                                       journal_folder=args.journal, log=log, fields=args.fields)
+                if (args.format == 'parquet'):
+                    folder = args.output or 'saved_data'
+                    if (not os.path.exists(folder)):
+                        os.makedirs(folder)
+                    path = os.path.join(folder, f"{name}.parquet")
+                    log(f"{name}: {write_parquet(journal, path)} rows written to {path}")
+                else:
+                    # several entities in one stream are tagged with the entity name
+                    write_ndjson(journal, out, entity=name if len(args.entities) > 1 else None)
+                if (not args.keep_journal):
+                    journal.clear()
+    finally:
+        if (output_file is not None):
+            output_file.close()
+
+
+if __name__ == '__main__':
+    main()
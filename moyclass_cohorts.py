@@ -0,0 +1,146 @@
+# coding=utf-8
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+
+def _month_number(dates):
+    return dates.dt.year * 12 + dates.dt.month
+
+
+def lesson_visits(lessons):
+    """
+    Разворачивает записи на занятия ( lessons с includeRecords=true ) в таблицу посещений
+
+    Explodes lesson records ( lessons loaded with includeRecords=true ) into a table of visits
+
+    :param lessons: lessons dataframe with 'records' column
+    :return: dataframe with userId, date columns ( only records with visit=True )
+    """
+    if (not len(lessons) or 'records' not in lessons.columns):
+        return pd.DataFrame({'userId': pd.Series(dtype='int64'), 'date': pd.Series(dtype='datetime64[ns]')})
+    records = lessons[['date', 'records']].explode('records').dropna(subset=['records'])
+    visits = pd.DataFrame({'userId': records['records'].map(lambda r: r.get('userId')).values,
+                           'visit': records['records'].map(lambda r: r.get('visit') is True).values,
+                           'date': pd.to_datetime(records['date'], errors='coerce').values})
+    visits = visits[visits['visit']].dropna(subset=['userId', 'date'])
+    return visits[['userId', 'date']].astype({'userId': 'int64'}).reset_index(drop=True)
+
+
+def _cohort_metrics(task):
+    """
+    Считает метрики одной когорты ( выполняется в отдельном процессе )
+
+    Computes metrics of one cohort ( runs in a worker process )
+    """
+    key, users, visits, max_months = task
+    size = len(users)
+    offsets = visits['offset']
+    retention = (visits[(offsets >= 0) & (offsets <= max_months)]
+                 .groupby('offset')['userId'].nunique()
+                 .reindex(range(max_months + 1), fill_value=0) / size)
+    converted = int(users['converted'].sum())
+    churned = int(users['churned'].sum())
+    summary = {'users': size,
+               'converted': converted,
+               'conversion_rate': converted / size,
+               'median_days_to_convert': users['days_to_convert'].median(),
+               'churned': churned,
+               'churn_rate': churned / converted if converted else float('nan')}
+    return key, summary, retention.values
+
+
+def cohort_analysis(users, joins, lessons, max_months=12, churn_days=31, as_of=None, active_status=2,
+                    workers=None):
+    """
+    Когортный анализ: удержание по месяцам, отток и конверсия лидов в учеников для каждого месяца привлечения
+     и способа заведения ( createSourceId ). Расчет разбит на когорты и выполняется в пуле процессов.
+
+    Cohort analytics: monthly retention, churn and lead-to-student conversion per acquisition month and
+     creation source ( createSourceId ). Calculation is chunked by cohort and runs in a process pool.
+
+    converted : user has a join with active_status or attended at least one lesson
+    churned : converted user without a join in active_status and without visits during the last churn_days
+    retention[k] : share of cohort users who attended a lesson in the k-th month after the acquisition month
+
+    :param users: users dataframe ( get_users ) with createdAt, createSourceId columns
+    :param joins: joins dataframe ( get_joins ) with userId, statusId, createdAt / stateChangedAt columns
+    :param lessons: lessons dataframe loaded with includeRecords=true
+    :param max_months: length of retention curves in months
+    :param churn_days: users without visits for this many days are churned
+    :param as_of: date of the analysis ( today by default )
+    :param active_status: join status of studying users ( 2 - 'Учится' )
+    :param workers: number of worker processes ( os.cpu_count() by default, 1 - no process pool )
+    :return: {
+                "summary": dataframe indexed by ( cohort, createSourceId ),
+                "retention": dataframe indexed by ( cohort, createSourceId ), columns - month offsets
+             }
+    """
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.today().date())
+    users = users[['id', 'createdAt'] + [col for col in ['createSourceId'] if col in users.columns]].copy()
+    if ('createSourceId' not in users.columns):
+        users['createSourceId'] = pd.NA
+    users['createdAt'] = pd.to_datetime(users['createdAt'], errors='coerce').dt.tz_localize(None)
+    users = users.dropna(subset=['createdAt'])
+    users['cohort'] = users['createdAt'].dt.to_period('M').astype(str)
+    users['createSourceId'] = pd.to_numeric(users['createSourceId'], errors='coerce').astype('Int64')
+    users = users.set_index('id')
+
+    visits = lesson_visits(lessons)
+    visits = visits[visits['userId'].isin(users.index)]
+    first_visit = visits.groupby('userId')['date'].min()
+    last_visit = visits.groupby('userId')['date'].max()
+
+    joins = joins.copy()
+    date_column = 'stateChangedAt' if 'stateChangedAt' in joins.columns else 'createdAt'
+    joins['date'] = pd.to_datetime(joins[date_column], errors='coerce').dt.tz_localize(None)
+    active_joins = joins[pd.to_numeric(joins['statusId'], errors='coerce') == active_status]
+    first_active = active_joins.groupby('userId')['date'].min()
+
+    conversion_date = pd.concat([first_visit.reindex(users.index), first_active.reindex(users.index)],
+                                axis=1).min(axis=1)
+    users['converted'] = conversion_date.notna()
+    users['days_to_convert'] = (conversion_date - users['createdAt']).dt.days
+    recent = last_visit.reindex(users.index) >= as_of - pd.Timedelta(days=churn_days)
+    users['churned'] = users['converted'] & ~users.index.isin(active_joins['userId']) & ~recent.fillna(False)
+
+    keys = ['cohort', 'createSourceId']
+    # integer cohort number, since users without createSourceId have NA in the key
+    users['cohort_number'] = users.groupby(keys, dropna=False).ngroup()
+    visits = visits.merge(users[['cohort_number', 'createdAt']], left_on='userId', right_index=True)
+    visits['offset'] = _month_number(visits['date']) - _month_number(visits['createdAt'])
+
+    visit_groups = dict(list(visits.groupby('cohort_number')))
+    tasks = []
+    for number, cohort_users in users.groupby('cohort_number'):
+        key = tuple(cohort_users[keys].iloc[0])
+        cohort_visits = visit_groups.get(number, visits.iloc[0:0])
+        tasks.append((key, cohort_users[['converted', 'churned', 'days_to_convert']],
+                      cohort_visits[['userId', 'offset']], max_months))
+
+    workers = workers or os.cpu_count() or 1
+    if (workers == 1 or len(tasks) < 2):
+        results = [_cohort_metrics(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_cohort_metrics, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    index = pd.MultiIndex.from_tuples([key for key, _, _ in results], names=keys)
+    summary = pd.DataFrame([summary for _, summary, _ in results], index=index).sort_index()
+    retention = pd.DataFrame([curve for _, _, curve in results], index=index,
+                             columns=range(max_months + 1)).sort_index()
+    return {'summary': summary, 'retention': retention}
+
+
+def load_cohort_analysis(api, load_new_data=True, **kwargs):
+    """
+    Загружает учеников, записи в группы и занятия с записями и строит когортный анализ ( см. cohort_analysis )
+
+    Loads users, joins and lessons with records and runs cohort analysis ( see cohort_analysis )
+    """
+    users = api.data_load(api.get_users, 'users', load_new_data=load_new_data)
+    joins = api.data_load(api.get_joins, 'joins', load_new_data=load_new_data)
+    lessons = api.data_load(api.get_lessons, 'lessons', params=[['includeRecords', 'true']],
+                            load_new_data=load_new_data)
+    return cohort_analysis(users, joins, lessons, **kwargs)
@@ -0,0 +1,193 @@
+# coding=utf-8
+import os
+import json
+from datetime import datetime
+import pandas as pd
+from moyclass_cache import file_lock
+
+
+def _hashable_column(column):
+    # a column changes its dtype when one of the rows lacks the field ( int -> float, bool -> object ), so values
+    #  are hashed in one representation and the same value gives the same hash in both snapshots
+    if (pd.api.types.is_bool_dtype(column)):
+        column = column.astype(object)
+    elif (pd.api.types.is_numeric_dtype(column)):
+        return column.astype('float64')
+    # lists and dicts ( e.g. 'filials', 'records' ) can't be hashed by pandas, so we hash their json form
+    if (column.dtype == object):
+        # map infers the dtype again ( object of booleans -> bool ), so the result is kept as object
+        return column.map(lambda value: json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+                          if isinstance(value, (list, dict)) else value).astype(object)
+    return column
+
+
+def column_hashes(df, id_col='id', columns=None):
+    """
+    Считает хэш каждой ячейки датафрейма ( по столбцам ). Строки индексируются по id.
+
+    Computes hash of every dataframe cell column by column. Rows are indexed by id.
+
+    :param df: dataframe with entities
+    :param id_col: name of the id column
+    :param columns: columns to hash ( all columns except id_col by default )
+    :return: dataframe of uint64 hashes with the same shape
+    """
+    if (columns is None):
+        columns = [col for col in df.columns if col != id_col]
+    hashes = {}
+    for col in columns:
+        if (col in df.columns):
+            hashes[col] = pd.util.hash_pandas_object(_hashable_column(df[col]), index=False).values
+        else:
+            hashes[col] = pd.util.hash_pandas_object(pd.Series([None] * len(df), dtype=object), index=False).values
+    return pd.DataFrame(hashes, index=df[id_col].values)
+
+
+def row_hashes(df, id_col='id'):
+    """
+    Считает хэш каждой строки датафрейма
+
+    Computes hash of every dataframe row
+
+    :return: series of uint64 hashes indexed by id
+    """
+    columns = sorted(col for col in df.columns if col != id_col)
+    frame = pd.DataFrame({col: _hashable_column(df[col]) for col in columns})
+    return pd.Series(pd.util.hash_pandas_object(frame, index=False).values, index=df[id_col].values)
+
+
+def snapshot_diff(old_df, new_df, id_col='id'):
+    """
+    Сравнивает два снимка сущностей и возвращает добавленные, удаленные и измененные id.
+     Сравнение векторизовано через хэши строк, поэтому работает на сотнях тысяч строк.
+
+    Compares two entity snapshots and returns added, removed and modified ids.
+     Comparison is vectorized over row hashes, so it scales to hundreds of thousands of rows.
+
+    :param old_df: previous snapshot ( dataframe )
+    :param new_df: new snapshot ( dataframe )
+    :param id_col: name of the id column. If an id is repeated, the last row with it is used
+    :return: {
+                "added": [id, ...],
+                "removed": [id, ...],
+                "modified": [ {"id": id, "columns": ["name", ...]}, ... ]
+             }
+    """
+    old_df = old_df.drop_duplicates(id_col, keep='last')
+    new_df = new_df.drop_duplicates(id_col, keep='last')
+    old_ids = pd.Index(old_df[id_col].values)
+    new_ids = pd.Index(new_df[id_col].values)
+    added = new_ids.difference(old_ids)
+    removed = old_ids.difference(new_ids)
+    common = new_ids.intersection(old_ids)
+
+    modified = []
+    if (len(common)):
+        old_common = old_df[old_df[id_col].isin(common)]
+        new_common = new_df[new_df[id_col].isin(common)]
+        old_rows = row_hashes(old_common, id_col).reindex(common)
+        new_rows = row_hashes(new_common, id_col).reindex(common)
+        changed_ids = common[(old_rows.values != new_rows.values)]
+        # if column sets differ every row hash differs, the cell comparison below keeps only real changes
+        if (len(changed_ids)):
+            columns = sorted(set(old_df.columns).union(new_df.columns) - {id_col})
+            old_cells = column_hashes(old_common[old_common[id_col].isin(changed_ids)], id_col, columns)
+            new_cells = column_hashes(new_common[new_common[id_col].isin(changed_ids)], id_col, columns)
+            changed_cells = old_cells.reindex(changed_ids) != new_cells.reindex(changed_ids)
+            for entity_id, row in changed_cells.iterrows():
+                changed_columns = [col for col in columns if row[col]]
+                if (changed_columns):
+                    modified.append({'id': _to_python(entity_id), 'columns': changed_columns})
+
+    return {'added': [_to_python(i) for i in added],
+            'removed': [_to_python(i) for i in removed],
+            'modified': modified}
+
+
+def _to_python(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+class ChangeFeed:
+    """
+    Лента изменений сущностей. Каждое сравнение снимков записывается в журнал
+     'saved_data/{entity_name}_changes.jsonl', а подписчики получают изменения сразу.
+
+    Change feed of entities. Every snapshot diff is appended to the
+     'saved_data/{entity_name}_changes.jsonl' journal and subscribers receive it immediately.
+
+    Example:
+        feed = ChangeFeed()
+        api.data_load(api.get_users, 'users', change_feed=feed)
+        for change in feed.read('users', since=last_seq):
+            ...
+    """
+
+    def __init__(self, folder='saved_data'):
+        self.folder = folder
+        self.subscribers = []
+        if (not os.path.exists(folder)):
+            os.makedirs(folder)
+
+    def _path(self, entity_name):
+        return os.path.join(self.folder, f"{entity_name}_changes.jsonl")
+
+    def _seq_path(self, entity_name):
+        return os.path.join(self.folder, f"{entity_name}_changes.seq")
+
+    def subscribe(self, callback):
+        """
+        :param callback: function called as callback(change) for every published change
+        """
+        self.subscribers.append(callback)
+
+    def last_seq(self, entity_name):
+        seq_path = self._seq_path(entity_name)
+        if (os.path.exists(seq_path)):
+            with open(seq_path, encoding='utf-8') as f:
+                seq = f.read().strip()
+            if (seq.isdigit()):
+                return int(seq)
+        # journals written before the sequence file existed ( or the file was cut by a crash )
+        seq = 0
+        for change in self.read(entity_name):
+            seq = change['seq']
+        return seq
+
+    def publish(self, entity_name, diff):
+        """
+        Записывает изменения в журнал и передает их подписчикам
+
+        Appends the diff to the journal and passes it to subscribers
+
+        :return: change dictionary with "seq", "entity", "time" keys added
+        """
+        # several processes ( a webhook receiver and data_load ) can publish to one journal
+        with file_lock(self._path(entity_name) + '.lock'):
+            change = {'seq': self.last_seq(entity_name) + 1, 'entity': entity_name,
+                      'time': datetime.now().isoformat()}
+            change.update(diff)
+            # the number is saved first: after a crash between the writes a number is skipped, but never repeated
+            with open(self._seq_path(entity_name), 'w', encoding='utf-8') as f:
+                f.write(str(change['seq']))
+            with open(self._path(entity_name), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(change, ensure_ascii=False) + "\n")
+        for callback in self.subscribers:
+            callback(change)
+        return change
+
+    def read(self, entity_name, since=0):
+        """
+        Возвращает изменения с номером больше since
+
+        Yields changes with sequence number greater than since
+        """
+        path = self._path(entity_name)
+        if (not os.path.exists(path)):
+            return
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if (line.strip()):
+                    change = json.loads(line)
+                    if (change['seq'] > since):
+                        yield change
@@ -0,0 +1,462 @@
+# coding=utf-8
+import bisect
+import pickle as pkl
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from moyclass_cache import atomic_pickle
+
+
+def _date(value):
+    if (value is None or (isinstance(value, float) and value != value)):
+        return None
+    return str(value)[:10]
+
+
+class MembershipIndex:
+    """
+    Индекс записей учеников в группы ( joins ). Отвечает на запросы "ученики группы", "группы ученика" и
+     "статус записи на дату" двоичным поиском без обращения к серверу. Данные хранятся в отсортированных массивах
+     целых чисел, индекс обновляется по изменениям ( updatedAt / stateChangedAt ).
+
+    Index of users memberships in classes ( joins ). Answers "users of class", "classes of user" and
+     "status at date" queries with binary search without network calls. Data is kept in sorted integer arrays and
+     the index is updated incrementally from updatedAt / stateChangedAt deltas.
+
+    Example:
+        index = MembershipIndex.from_joins(api.data_load(api.get_joins, 'joins'))
+        index.classes_of_user(userId, statusId=2)
+    """
+
+    def __init__(self):
+        # rows are sorted by join id, so a join is found with searchsorted
+        self.join_ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.status_ids = np.empty(0, dtype=np.int32)
+        self.history = {}  # join id -> [ [date, statusId], ... ] sorted by date
+        self.last_refresh = None
+        self._pending = {}  # join id -> ( userId, classId, statusId ) or None for deleted joins
+        # rows sorted by ( userId, classId ) and by classId, with their sorted keys
+        self._user_order = np.empty(0, dtype=np.int64)
+        self._user_keys = np.empty(0, dtype=np.int64)
+        self._user_class_keys = np.empty(0, dtype=np.int64)
+        self._class_order = np.empty(0, dtype=np.int64)
+        self._class_keys = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_joins(cls, joins):
+        """
+        :param joins: joins dataframe or list of dictionaries ( get_joins )
+        """
+        index = cls()
+        index.update(joins)
+        return index
+
+    def _flush(self):
+        """
+        Применяет накопленные изменения. Изменение статуса записывается на месте, добавленные и удаленные записи
+         вставляются в отсортированные массивы и удаляются из них без пересортировки индекса
+
+        Applies pending changes. Status changes are written in place, added and removed joins are inserted into
+         and deleted from the sorted arrays without sorting the index again
+        """
+        if (not self._pending):
+            return
+        ids = np.array(sorted(self._pending), dtype=np.int64)
+        rows = [self._pending[join_id] for join_id in ids.tolist()]
+        deleted = np.array([row is None for row in rows], dtype=bool)
+        values = np.array([row or (0, 0, 0) for row in rows], dtype=np.int64).reshape(-1, 3)
+        users, classes, statuses = values[:, 0], values[:, 1], values[:, 2]
+        pos = np.searchsorted(self.join_ids, ids)
+        found = pos < len(self.join_ids)
+        found[found] = self.join_ids[pos[found]] == ids[found]
+        moved = found.copy()
+        moved[found] = (self.user_ids[pos[found]] != users[found]) | (self.class_ids[pos[found]] != classes[found])
+        in_place = found & ~deleted & ~moved
+        self.status_ids[pos[in_place]] = statuses[in_place]
+        removed = found & (deleted | moved)
+        if (removed.any()):
+            self._delete_rows(pos[removed])
+        added = ~deleted & (~found | moved)
+        if (added.any()):
+            self._insert_rows(ids[added], users[added], classes[added], statuses[added])
+        self._pending = {}
+
+    def _delete_rows(self, rows):
+        keep = np.ones(len(self.join_ids), dtype=bool)
+        keep[rows] = False
+        new_rows = np.cumsum(keep) - 1
+        user_keep = keep[self._user_order]
+        self._user_order = new_rows[self._user_order[user_keep]]
+        self._user_keys = self._user_keys[user_keep]
+        self._user_class_keys = self._user_class_keys[user_keep]
+        class_keep = keep[self._class_order]
+        self._class_order = new_rows[self._class_order[class_keep]]
+        self._class_keys = self._class_keys[class_keep]
+        self.join_ids = self.join_ids[keep]
+        self.user_ids = self.user_ids[keep]
+        self.class_ids = self.class_ids[keep]
+        self.status_ids = self.status_ids[keep]
+
+    def _insert_rows(self, ids, users, classes, statuses):
+        # ids are sorted, np.insert puts every new row before the old row at its position
+        at = np.searchsorted(self.join_ids, ids)
+        rows = at + np.arange(len(at))
+        self._user_order = self._user_order + np.searchsorted(at, self._user_order, side='right')
+        self._class_order = self._class_order + np.searchsorted(at, self._class_order, side='right')
+        self.join_ids = np.insert(self.join_ids, at, ids)
+        self.user_ids = np.insert(self.user_ids, at, users)
+        self.class_ids = np.insert(self.class_ids, at, classes)
+        self.status_ids = np.insert(self.status_ids, at, statuses.astype(np.int32))
+
+        by_pair = np.lexsort((classes, users))
+        positions = []
+        for user, class_id in zip(users[by_pair].tolist(), classes[by_pair].tolist()):
+            start, end = self._user_range(user)
+            positions.append(start + np.searchsorted(self._user_class_keys[start:end], class_id, side='right'))
+        self._user_order = np.insert(self._user_order, positions, rows[by_pair])
+        self._user_keys = np.insert(self._user_keys, positions, users[by_pair])
+        self._user_class_keys = np.insert(self._user_class_keys, positions, classes[by_pair])
+
+        by_class = np.argsort(classes, kind='stable')
+        positions = np.searchsorted(self._class_keys, classes[by_class], side='right')
+        self._class_order = np.insert(self._class_order, positions, rows[by_class])
+        self._class_keys = np.insert(self._class_keys, positions, classes[by_class])
+
+    def _user_range(self, userId):
+        return (np.searchsorted(self._user_keys, userId, side='left'),
+                np.searchsorted(self._user_keys, userId, side='right'))
+
+    def update(self, joins):
+        """
+        Добавляет или обновляет записи в индексе. Изменения статуса сохраняются в истории.
+
+        Adds or updates joins in the index. Status changes are kept in the history.
+
+        :param joins: joins dataframe or list of dictionaries
+        """
+        if (isinstance(joins, pd.DataFrame)):
+            joins = joins.to_dict(orient='records')
+        for join in joins:
+            join_id = int(join['id'])
+            status = int(join['statusId'])
+            self._pending[join_id] = (int(join['userId']), int(join['classId']), status)
+            date = _date(join.get('stateChangedAt')) or _date(join.get('createdAt')) or '0000-00-00'
+            history = self.history.setdefault(join_id, [])
+            if ([date, status] not in history and (not history or history[-1][1] != status or history[-1][0] > date)):
+                bisect.insort(history, [date, status])
+
+    def remove(self, join_ids):
+        """
+        Удаляет записи из индекса
+
+        Removes joins from the index
+        """
+        for join_id in join_ids:
+            self._pending[int(join_id)] = None
+            self.history.pop(int(join_id), None)
+
+    def _select(self, rows, values, statusId):
+        if (statusId is not None):
+            rows = rows[self.status_ids[rows] == int(statusId)]
+        return values[rows]
+
+    def users_of_class(self, classId, statusId=None):
+        """
+        Возвращает id учеников группы ( с указанным статусом записи, если он передан )
+
+        Returns ids of users of the class ( with the given join status if passed )
+        """
+        self._flush()
+        classId = int(classId)
+        start = np.searchsorted(self._class_keys, classId, side='left')
+        end = np.searchsorted(self._class_keys, classId, side='right')
+        return self._select(self._class_order[start:end], self.user_ids, statusId)
+
+    def classes_of_user(self, userId, statusId=None):
+        """
+        Возвращает id групп ученика ( с указанным статусом записи, если он передан )
+
+        Returns ids of classes of the user ( with the given join status if passed )
+        """
+        self._flush()
+        start, end = self._user_range(int(userId))
+        return self._select(self._user_order[start:end], self.class_ids, statusId)
+
+    def status_at(self, userId, classId, date):
+        """
+        Возвращает статус записи ученика в группу на дату или None, если запись на эту дату неизвестна
+
+        Returns status of the user's join to the class at the date or None if the join is unknown at that date
+
+        :param date: date ( "2021-11-01" or date )
+        """
+        self._flush()
+        start, end = self._user_range(int(userId))
+        # the most recently added join of the pair
+        i = start + np.searchsorted(self._user_class_keys[start:end], int(classId), side='right') - 1
+        if (i < start or self._user_class_keys[i] != int(classId)):
+            return None
+        history = self.history.get(int(self.join_ids[self._user_order[i]]), [])
+        i = bisect.bisect_right(history, [str(date)[:10], float('inf')])
+        return history[i - 1][1] if i else None
+
+    def refresh(self, api, params=None):
+        """
+        Загружает записи, измененные с последнего обновления ( updatedAt и stateChangedAt ), и обновляет индекс.
+         При первом вызове загружаются все записи.
+
+        Loads joins changed since the last refresh ( updatedAt and stateChangedAt ) and updates the index.
+         The first call loads all joins.
+
+        :param api: MoyClassCompanyAPI object
+        :param params: extra get_joins params, e.g. [['filialId', 1]]. Note that with a statusId filter joins
+         which left that status are not returned, so they keep their old status in the index
+        :return: number of updated joins
+        """
+        today = datetime.today().date()
+        params = list(params or [])
+        if (self.last_refresh is None):
+            specs = [params]
+        else:
+            specs = [params + [[field, f"{self.last_refresh}"], [field, f"{today}"]]
+                     for field in ('updatedAt', 'stateChangedAt')]
+        updated = {}
+        for spec in specs:
+            for page in api.iter_pages(api.get_joins, 'joins', spec):
+                for join in page['joins']:
+                    updated[join['id']] = join
+        self.update(list(updated.values()))
+        self.last_refresh = today
+        return len(updated)
+
+    def save(self, path='saved_data/membership_index.pkl'):
+        self._flush()
+        atomic_pickle(path, self)
+
+    @staticmethod
+    def load(path='saved_data/membership_index.pkl'):
+        with open(path, 'rb') as f:
+            return pkl.load(f)
+
+
+class LessonCalendar:
+    """
+    Локальный календарь занятий. Занятия хранятся в массивах, отсортированных по времени начала, отдельно для
+     каждой аудитории, преподавателя и группы. Календарь отвечает на запросы "занятия в промежутке времени",
+     "пересечения занятий в аудитории / у преподавателя" и "ближайшие N занятий группы" без обращения к серверу.
+
+    Local lesson calendar. Lessons are kept in arrays sorted by start time per room, teacher and class.
+     The calendar answers "lessons in window", "room / teacher overlaps" and "next N lessons of class" queries
+     without network calls.
+
+    Example:
+        calendar = LessonCalendar()
+        calendar.refresh(api, '2021-11-01', '2021-11-30')
+        calendar.overlaps('roomId')
+    """
+
+    KEYS = ['roomId', 'teacherId', 'classId']
+
+    def __init__(self):
+        self.lessons = self._empty()
+        self._dirty = True
+
+    @staticmethod
+    def _empty():
+        lessons = pd.DataFrame({'date': pd.Series(dtype=object), 'start': pd.Series(dtype='datetime64[ns]'),
+                                'end': pd.Series(dtype='datetime64[ns]'), 'roomId': pd.Series(dtype=float),
+                                'classId': pd.Series(dtype=float), 'teacherIds': pd.Series(dtype=object)})
+        lessons.index.name = 'id'
+        return lessons
+
+    @classmethod
+    def from_lessons(cls, lessons):
+        """
+        :param lessons: lessons dataframe or list of dictionaries ( get_lessons )
+        """
+        calendar = cls()
+        calendar.update(lessons)
+        return calendar
+
+    @staticmethod
+    def _frame(lessons):
+        df = pd.DataFrame(lessons)
+        if (not len(df)):
+            return LessonCalendar._empty()
+        date = df['date'].astype(str).str[:10]
+        df['start'] = pd.to_datetime(date + ' ' + df.get('beginTime', pd.Series('00:00', index=df.index)).fillna('00:00'),
+                                     errors='coerce')
+        df['end'] = pd.to_datetime(date + ' ' + df.get('endTime', pd.Series('00:00', index=df.index)).fillna('00:00'),
+                                   errors='coerce')
+        df['end'] = df['end'].where(df['end'] > df['start'], df['start'])
+        df['date'] = date
+        for col in ['roomId', 'classId']:
+            if (col not in df.columns):
+                df[col] = None
+        if ('teacherIds' not in df.columns):
+            df['teacherIds'] = [[] for _ in range(len(df))]
+        return df.set_index('id')
+
+    def update(self, lessons):
+        """
+        Добавляет или обновляет занятия
+
+        Adds or updates lessons
+
+        :param lessons: lessons dataframe or list of dictionaries
+        """
+        if (isinstance(lessons, pd.DataFrame)):
+            lessons = lessons.to_dict(orient='records')
+        df = self._frame(lessons)
+        self.lessons = pd.concat([self.lessons[~self.lessons.index.isin(df.index)], df])
+        self.lessons.index.name = 'id'
+        self._dirty = True
+
+    def remove(self, lesson_ids):
+        """
+        Удаляет занятия из календаря
+
+        Removes lessons from the calendar
+        """
+        self.lessons = self.lessons[~self.lessons.index.isin(list(lesson_ids))]
+        self._dirty = True
+
+    def refresh(self, api, date_from, date_to, params=None):
+        """
+        Загружает занятия за промежуток дат и заменяет ими занятия календаря за эти даты
+         ( удаленные на сервере занятия пропадают из календаря )
+
+        Loads lessons of the date window and replaces calendar lessons of these dates with them
+         ( lessons deleted on the server disappear from the calendar )
+
+        :param api: MoyClassCompanyAPI object
+        :param date_from: first date of the window
+        :param date_to: last date of the window
+        :param params: extra get_lessons params, e.g. [['filialId', 1]]. Lessons of the window that don't match
+         these params are removed from the calendar as well
+        :return: number of loaded lessons
+        """
+        window = [['date', f"{date_from}"], ['date', f"{date_to}"]]
+        lessons = []
+        for page in api.iter_pages(api.get_lessons, 'lessons', window + list(params or [])):
+            lessons += page['lessons']
+        in_window = (self.lessons['date'] >= str(date_from)[:10]) & (self.lessons['date'] <= str(date_to)[:10])
+        self.lessons = self.lessons[~in_window]
+        self.update(lessons)
+        return len(lessons)
+
+    def _build(self):
+        if (not self._dirty):
+            return
+        lessons = self.lessons.dropna(subset=['start']).sort_values('start', kind='stable')
+        self._ids = lessons.index.values
+        self._starts = lessons['start'].values.astype('datetime64[m]').astype(np.int64)
+        self._ends = lessons['end'].values.astype('datetime64[m]').astype(np.int64)
+        self._max_duration = int((self._ends - self._starts).max()) if len(self._ids) else 0
+        positions = np.arange(len(self._ids))
+        self._groups = {}
+        for key, column in [('roomId', 'roomId'), ('classId', 'classId')]:
+            values = pd.to_numeric(lessons[column], errors='coerce').values
+            self._groups[key] = self._split(values, positions)
+        teachers = lessons['teacherIds'].map(lambda ids: ids if isinstance(ids, (list, tuple, np.ndarray)) else [])
+        counts = teachers.map(len).values.astype(np.int64)
+        teacher_values = np.array([t for ids in teachers for t in ids], dtype=float)
+        self._groups['teacherId'] = self._split(teacher_values, np.repeat(positions, counts))
+        self._dirty = False
+
+    @staticmethod
+    def _split(values, positions):
+        """
+        Группирует позиции занятий ( уже отсортированные по началу ) по значению ключа
+
+        Groups lesson positions ( already sorted by start ) by key value
+        """
+        mask = ~np.isnan(values)
+        values, positions = values[mask].astype(np.int64), positions[mask]
+        order = np.argsort(values, kind='stable')
+        values, positions = values[order], positions[order]
+        unique, starts = np.unique(values, return_index=True)
+        bounds = list(starts[1:]) + [len(values)]
+        return {key: positions[start:end] for key, start, end in zip(unique.tolist(), starts.tolist(), bounds)}
+
+    @staticmethod
+    def _minutes(value):
+        return np.datetime64(pd.Timestamp(value), 'm').astype(np.int64)
+
+    def _positions(self, key=None, value=None):
+        if (key is None):
+            return None
+        if (key not in self.KEYS):
+            raise ValueError(f"Key should be one of {self.KEYS}")
+        return self._groups[key].get(int(value), np.empty(0, dtype=np.int64))
+
+    def in_window(self, start, end, roomId=None, teacherId=None, classId=None):
+        """
+        Возвращает занятия, которые пересекаются с промежутком времени [ start, end )
+
+        Returns lessons that intersect the time window [ start, end )
+
+        :param start: window start ( "2021-11-01 10:00", datetime or date )
+        :param end: window end
+        :param roomId: only lessons in this room
+        :param teacherId: only lessons of this teacher
+        :param classId: only lessons of this class
+        :return: dataframe of lessons sorted by start
+        """
+        self._build()
+        start, end = self._minutes(start), self._minutes(end)
+        positions = None
+        for key, value in [('roomId', roomId), ('teacherId', teacherId), ('classId', classId)]:
+            if (value is not None):
+                key_positions = self._positions(key, value)
+                positions = key_positions if positions is None else np.intersect1d(positions, key_positions)
+        if (positions is None):
+            # lessons starting after the window end or ending before its start can't intersect it
+            lo = np.searchsorted(self._starts, start - self._max_duration, side='left')
+            hi = np.searchsorted(self._starts, end, side='left')
+            positions = np.arange(lo, hi)
+        positions = positions[(self._starts[positions] < end) & (self._ends[positions] > start)]
+        return self.lessons.loc[self._ids[np.sort(positions)]]
+
+    def overlaps(self, key='roomId'):
+        """
+        Находит пересекающиеся по времени занятия в одной аудитории ( key='roomId' ) или у одного преподавателя
+         ( key='teacherId' )
+
+        Finds lessons overlapping in time in the same room ( key='roomId' ) or of the same teacher ( key='teacherId' )
+
+        :return: dataframe with key, lessonId, otherLessonId columns
+        """
+        self._build()
+        rows = []
+        for value, positions in self._positions_by(key).items():
+            active = []  # positions of lessons that haven't ended yet, sweeping by start time
+            for pos in positions:
+                active = [other for other in active if self._ends[other] > self._starts[pos]]
+                rows += [[value, self._ids[other], self._ids[pos]] for other in active]
+                active.append(pos)
+        return pd.DataFrame(rows, columns=[key, 'lessonId', 'otherLessonId'])
+
+    def _positions_by(self, key):
+        if (key not in self.KEYS):
+            raise ValueError(f"Key should be one of {self.KEYS}")
+        return self._groups[key]
+
+    def next_lessons(self, classId, n=1, after=None):
+        """
+        Возвращает N ближайших занятий группы, которые начинаются после указанного времени
+
+        Returns next N lessons of the class starting after the given time
+
+        :param classId: ID группы
+        :param n: number of lessons
+        :param after: time ( now by default )
+        :return: dataframe of lessons sorted by start
+        """
+        self._build()
+        positions = self._positions('classId', classId)
+        after = self._minutes(after if after is not None else datetime.now())
+        first = np.searchsorted(self._starts[positions], after, side='left')
+        return self.lessons.loc[self._ids[positions[first:first + n]]]
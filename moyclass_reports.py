@@ -0,0 +1,186 @@
+# coding=utf-8
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+
+# Названия полей абонемента ученика, из которых считается остаток ( user subscription fields used for leftovers )
+SUBSCRIPTION_PRICE_FIELD = 'price'
+SUBSCRIPTION_VISITS_FIELD = 'visitCount'
+SUBSCRIPTION_VISITED_FIELDS = ['visitedCount', 'stats.totalVisited']
+
+
+def fetch_financials(api, date_from, date_to, unpaid_invoices=True):
+    """
+    Загружает платежи ( вместе со счетами, appendInvoices=true ), абонементы учеников и группы параллельно
+
+    Loads payments ( together with their invoices, appendInvoices=true ), users subscriptions and classes
+     in parallel
+
+    :param api: MoyClassCompanyAPI object
+    :param date_from: first payment date ( string "2021-10-01" or date )
+    :param date_to: last payment date
+    :param unpaid_invoices: if True invoices created in the period are loaded as well ( in the same parallel
+     batch ), since invoices without any payment are not appended to payments
+    :return: dict of dataframes { "payments", "invoices", "subscriptions", "classes" }
+    """
+    def load_payments():
+        params = [['date', f"{date_from}"], ['date', f"{date_to}"], ['appendInvoices', 'true']]
+        payments, invoices = [], []
+        for page in api.iter_pages(api.get_payments, 'payments', params):
+            payments += page['payments']
+            invoices += page.get('invoices', [])
+            invoices += [payment['invoice'] for payment in page['payments'] if payment.get('invoice')]
+        return payments, invoices
+
+    def load_invoices():
+        if (not unpaid_invoices):
+            return []
+        params = [['createdAt', f"{date_from}"], ['createdAt', f"{date_to}"]]
+        invoices = []
+        for page in api.iter_pages(api.get_invoices, 'invoices', params):
+            invoices += page['invoices']
+        return invoices
+
+    def load_subscriptions():
+        subscriptions = []
+        for page in api.iter_pages(api.get_userSubscriptions, 'subscriptions'):
+            subscriptions += page['subscriptions']
+        return subscriptions
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        payments_future = executor.submit(load_payments)
+        invoices_future = executor.submit(load_invoices)
+        subscriptions_future = executor.submit(load_subscriptions)
+        classes_future = executor.submit(api.get_classes)
+        payments, appended_invoices = payments_future.result()
+        invoices = appended_invoices + invoices_future.result()
+        subscriptions = subscriptions_future.result()
+        classes = classes_future.result()
+
+    invoices_df = pd.DataFrame(invoices)
+    if (len(invoices_df)):
+        invoices_df = invoices_df.drop_duplicates('id', keep='last').reset_index(drop=True)
+    return {'payments': pd.DataFrame(payments),
+            'invoices': invoices_df,
+            'subscriptions': pd.json_normalize(subscriptions) if subscriptions else pd.DataFrame(),
+            'classes': pd.DataFrame(classes)}
+
+
+def _typed(df, numeric=(), dates=(), ids=()):
+    df = df.copy()
+    for col in numeric:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0) if col in df.columns else 0.0
+    for col in dates:
+        df[col] = pd.to_datetime(df[col], errors='coerce') if col in df.columns else pd.NaT
+    for col in ids:
+        df[col] = (pd.to_numeric(df[col], errors='coerce').astype('Int64') if col in df.columns
+                   else pd.Series(pd.NA, index=df.index, dtype='Int64'))
+    return df
+
+
+def _dimensions(df, subscriptions, classes, subscription_col='userSubscriptionId'):
+    """
+    Добавляет столбцы filialId и courseId через абонемент ученика и его основную группу
+
+    Adds filialId and courseId columns through the user subscription and its main class
+    """
+    classes = _typed(classes, ids=['id', 'courseId', 'filialId'])
+    classes = classes[['id', 'courseId', 'filialId']].rename(
+        columns={'id': 'mainClassId', 'filialId': 'classFilialId'})
+    subscriptions = _typed(subscriptions, ids=['id', 'mainClassId'])[['id', 'mainClassId']]
+    subscriptions = subscriptions.rename(columns={'id': subscription_col})
+    df = _typed(df.drop(columns=[col for col in ['mainClassId', 'courseId'] if col in df.columns]),
+                ids=[subscription_col])
+    df = df.merge(subscriptions, on=subscription_col, how='left').merge(classes, on='mainClassId', how='left')
+    if ('filialId' in df.columns):
+        df['filialId'] = pd.to_numeric(df['filialId'], errors='coerce').astype('Int64').fillna(df['classFilialId'])
+    else:
+        df['filialId'] = df['classFilialId']
+    return df.drop(columns=['classFilialId'])
+
+
+def financial_report(payments, invoices, subscriptions, classes, freq='M', by=('filialId', 'courseId')):
+    """
+    Считает выручку, возвраты, долг и отложенную выручку по филиалам, программам и месяцам.
+     Все вычисления векторизованы ( groupby по типизированным столбцам ).
+
+    Computes revenue, refunds, debt and deferred revenue per filial / course / month.
+     All calculations are vectorized ( groupby over typed columns ).
+
+    revenue : sum of incoming payments ( optype = income ), by payment date
+    refunds : sum of refunds ( optype = refund ), positive numbers, by payment date
+    net_revenue : revenue - refunds
+    debt : unpaid part of invoices ( price minus debits made against the invoice ), by invoice creation date
+    deferred_revenue : part of subscription price not yet used by visits ( active and frozen subscriptions ),
+     by subscription sell date
+
+    :param payments: payments dataframe ( get_payments )
+    :param invoices: invoices dataframe ( get_invoices )
+    :param subscriptions: users subscriptions dataframe ( get_userSubscriptions, flattened with pd.json_normalize )
+    :param classes: classes dataframe ( get_classes )
+    :param freq: period of the report ( pandas frequency, 'M' - month )
+    :param by: dimensions of the report
+    :return: dataframe indexed by by + ( 'period', ) with revenue, refunds, net_revenue, debt, deferred_revenue
+    """
+    by = list(by)
+    keys = by + ['period']
+    parts = []
+
+    payments = _typed(payments, numeric=['summa'], dates=['date'], ids=['invoiceId', 'userSubscriptionId'])
+    if (len(invoices) and 'userSubscriptionId' in invoices.columns):
+        # income payments are made against invoices, their subscription is known only from the invoice
+        invoice_subscriptions = _typed(invoices, ids=['id', 'userSubscriptionId'])[['id', 'userSubscriptionId']]
+        invoice_subscriptions = invoice_subscriptions.drop_duplicates('id', keep='last').rename(
+            columns={'id': 'invoiceId', 'userSubscriptionId': 'invoiceSubscriptionId'})
+        payments = payments.merge(invoice_subscriptions, on='invoiceId', how='left')
+        payments['userSubscriptionId'] = payments['userSubscriptionId'].fillna(payments['invoiceSubscriptionId'])
+        payments = payments.drop(columns=['invoiceSubscriptionId'])
+    payments = _dimensions(payments, subscriptions, classes)
+    payments['period'] = payments['date'].dt.to_period(freq)
+    optype = payments['optype'] if 'optype' in payments.columns else pd.Series('', index=payments.index)
+    payments['revenue'] = payments['summa'].where(optype == 'income', 0.0)
+    payments['refunds'] = payments['summa'].abs().where(optype == 'refund', 0.0)
+    parts.append(payments.groupby(keys, dropna=False)[['revenue', 'refunds']].sum())
+
+    if (len(invoices)):
+        invoices = _typed(invoices, numeric=['price'], dates=['createdAt'], ids=['id'])
+        debits = payments[optype == 'debit'].groupby('invoiceId')['summa'].sum().abs().rename('paid')
+        invoices = invoices.merge(debits, left_on='id', right_index=True, how='left')
+        invoices['debt'] = (invoices['price'] - invoices['paid'].fillna(0.0)).clip(lower=0.0)
+        invoices = _dimensions(invoices, subscriptions, classes)
+        invoices['period'] = invoices['createdAt'].dt.to_period(freq)
+        parts.append(invoices.groupby(keys, dropna=False)[['debt']].sum())
+
+    if (len(subscriptions)):
+        subs = _typed(subscriptions, numeric=[SUBSCRIPTION_PRICE_FIELD, SUBSCRIPTION_VISITS_FIELD],
+                      dates=['sellDate'], ids=['statusId'])
+        visited = pd.Series(0.0, index=subs.index)
+        for field in SUBSCRIPTION_VISITED_FIELDS:
+            if (field in subs.columns):
+                visited = pd.to_numeric(subs[field], errors='coerce').fillna(0.0)
+                break
+        visits = subs[SUBSCRIPTION_VISITS_FIELD]
+        left_share = ((visits - visited) / visits.where(visits > 0)).clip(0.0, 1.0).fillna(0.0)
+        active = subs['statusId'].isin([2, 3]).fillna(False)
+        subs['deferred_revenue'] = (subs[SUBSCRIPTION_PRICE_FIELD] * left_share).where(active, 0.0)
+        subs = _dimensions(subs.rename(columns={'id': 'userSubscriptionId'}), subscriptions, classes)
+        subs['period'] = subs['sellDate'].dt.to_period(freq)
+        parts.append(subs.groupby(keys, dropna=False)[['deferred_revenue']].sum())
+
+    report = pd.concat(parts, axis=1).fillna(0.0)
+    for col in ['revenue', 'refunds', 'debt', 'deferred_revenue']:
+        if (col not in report.columns):
+            report[col] = 0.0
+    report['net_revenue'] = report['revenue'] - report['refunds']
+    return report[['revenue', 'refunds', 'net_revenue', 'debt', 'deferred_revenue']].sort_index()
+
+
+def load_financial_report(api, date_from, date_to, freq='M', by=('filialId', 'courseId')):
+    """
+    Загружает данные и строит финансовый отчет ( см. financial_report )
+
+    Loads data and builds financial report ( see financial_report )
+    """
+    data = fetch_financials(api, date_from, date_to)
+    return financial_report(data['payments'], data['invoices'], data['subscriptions'], data['classes'],
+                            freq=freq, by=by)
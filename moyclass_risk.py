@@ -0,0 +1,236 @@
+# coding=utf-8
+from datetime import datetime
+import pandas as pd
+
+
+RECORD_COLUMNS = ['recordId', 'userId', 'lessonId', 'classId', 'date', 'visit', 'goodReason']
+
+
+def lesson_records_frame(lessons):
+    """
+    Разворачивает записи на занятия из lessons ( includeRecords=true ) в типизированную таблицу
+
+    Explodes lesson records of lessons ( loaded with includeRecords=true ) into a typed table
+
+    :param lessons: lessons dataframe with classId, date and records columns
+    :return: dataframe with RECORD_COLUMNS
+    """
+    if (not len(lessons) or 'records' not in lessons.columns):
+        return _typed_records(pd.DataFrame(columns=RECORD_COLUMNS))
+    exploded = lessons[['id', 'classId', 'date', 'records']].explode('records').dropna(subset=['records'])
+    records = exploded['records']
+    frame = pd.DataFrame({'recordId': records.map(lambda r: r.get('id')).values,
+                          'userId': records.map(lambda r: r.get('userId')).values,
+                          'lessonId': exploded['id'].values,
+                          'classId': exploded['classId'].values,
+                          'date': exploded['date'].values,
+                          # only boolean True is a visit ( the same way badUsersSearch treated records )
+                          'visit': records.map(lambda r: r.get('visit') is True).values,
+                          'goodReason': records.map(lambda r: r.get('goodReason') is True).values})
+    return _typed_records(frame)
+
+
+def _typed_records(frame):
+    frame = frame.copy()
+    for col in ['recordId', 'userId', 'lessonId', 'classId']:
+        frame[col] = pd.to_numeric(frame[col], errors='coerce').astype('Int64')
+    frame['date'] = pd.to_datetime(frame['date'], errors='coerce')
+    frame['visit'] = frame['visit'].astype(bool)
+    frame['goodReason'] = frame['goodReason'].astype(bool)
+    return frame[RECORD_COLUMNS]
+
+
+class RiskContext:
+    """
+    Данные для расчета риска оттока: записи на занятия, записи в группы и ( необязательно ) абонементы учеников
+
+    Data for churn-risk scoring: lesson records, memberships and ( optionally ) users subscriptions
+
+    :param records: dataframe with RECORD_COLUMNS ( see lesson_records_frame )
+    :param memberships: dataframe with userId, classId columns - classes where the user studies ( e.g. joins with
+     statusId=2 ). If None all classes of the records are used
+    :param subscriptions: users subscriptions dataframe with userId, endDate, statusId columns
+    :param as_of: date of the scoring ( today by default )
+    """
+
+    def __init__(self, records, memberships=None, subscriptions=None, as_of=None):
+        self.records = records
+        self.memberships = memberships
+        self.subscriptions = subscriptions
+        self.as_of = pd.Timestamp(as_of if as_of is not None else datetime.today().date())
+
+    def study_records(self):
+        if (self.memberships is None):
+            return self.records
+        pairs = self.memberships[['userId', 'classId']].drop_duplicates().astype('Int64')
+        return self.records.merge(pairs, on=['userId', 'classId'])
+
+    def restricted(self, user_ids):
+        """
+        Возвращает контекст только с данными указанных учеников
+
+        Returns context with the data of the given users only
+        """
+        records = self.records[self.records['userId'].isin(user_ids)]
+        memberships = self.memberships
+        if (memberships is not None):
+            memberships = memberships[memberships['userId'].isin(user_ids)]
+        subscriptions = self.subscriptions
+        if (subscriptions is not None):
+            subscriptions = subscriptions[subscriptions['userId'].isin(user_ids)]
+        return RiskContext(records, memberships, subscriptions, self.as_of)
+
+
+class RecentAttendanceRule:
+    """
+    Ученик в зоне риска, если ни в одной из его групп он не посетил хотя бы одно из последних last_n занятий
+     за последние window_days дней.
+
+    User is at risk if in none of his classes he attended at least one of the last last_n lessons
+     during the last window_days days.
+
+    :param window_days: length of the window in days
+    :param last_n: number of last lessons checked in every class
+    :param good_reason: how absences with a good reason are treated:
+        'miss' - as a missed lesson, 'visit' - as a visit, 'skip' - such lessons are not counted
+    :param no_lessons_score: score of users without lessons in the window ( None - such users are not scored )
+    :param weight: weight of the rule in the total score
+    """
+
+    def __init__(self, window_days=31, last_n=2, good_reason='miss', no_lessons_score=None, weight=1.0):
+        if (good_reason not in ('miss', 'visit', 'skip')):
+            raise ValueError("good_reason should be one of 'miss', 'visit', 'skip'")
+        self.name = 'recent_attendance'
+        self.window_days = window_days
+        self.last_n = last_n
+        self.good_reason = good_reason
+        self.no_lessons_score = no_lessons_score
+        self.weight = weight
+
+    def evaluate(self, context):
+        """
+        :return: series of scores ( 0 - fine, 1 - at risk ) indexed by userId
+        """
+        records = context.study_records()
+        window_start = context.as_of - pd.Timedelta(days=self.window_days)
+        records = records[(records['date'] >= window_start) & (records['date'] <= context.as_of)]
+        if (self.good_reason == 'skip'):
+            records = records[records['visit'] | ~records['goodReason']]
+        attended = records['visit'] | (records['goodReason'] if self.good_reason == 'visit' else False)
+        records = records.assign(attended=attended).sort_values('date', kind='stable')
+        last_lessons = records.groupby(['userId', 'classId']).tail(self.last_n)
+        good = last_lessons.groupby('userId')['attended'].any()
+        scores = (~good).astype(float)
+        if (self.no_lessons_score is not None and context.memberships is not None):
+            users = pd.Index(context.memberships['userId'].dropna().astype('int64').unique())
+            scores = scores.reindex(users.union(scores.index), fill_value=float(self.no_lessons_score))
+        return scores
+
+
+class SubscriptionExpiryRule:
+    """
+    Ученик в зоне риска, если все его активные абонементы заканчиваются в ближайшие days дней
+     ( или у него нет активных абонементов )
+
+    User is at risk if all his active subscriptions end within the next days days ( or he has no active
+     subscriptions )
+
+    :param days: number of days before the end of subscription
+    :param weight: weight of the rule in the total score
+    """
+
+    def __init__(self, days=7, weight=1.0):
+        self.name = 'subscription_expiry'
+        self.days = days
+        self.weight = weight
+
+    def evaluate(self, context):
+        subscriptions = context.subscriptions
+        users = context.records['userId'].dropna().unique()
+        if (subscriptions is None):
+            return pd.Series(dtype=float)
+        active = subscriptions[pd.to_numeric(subscriptions['statusId'], errors='coerce') == 2]
+        end = pd.to_datetime(active['endDate'], errors='coerce').fillna(pd.Timestamp.max)
+        last_end = end.groupby(pd.to_numeric(active['userId'], errors='coerce')).max()
+        expiring = (last_end <= context.as_of + pd.Timedelta(days=self.days)).astype(float)
+        return expiring.reindex(pd.Index(users).union(expiring.index), fill_value=1.0)
+
+
+class RiskScoringEngine:
+    """
+    Настраиваемый расчет риска оттока учеников. Правила подключаются списком, каждое правило возвращает оценку
+     от 0 до 1 для каждого ученика, итоговая оценка - взвешенное среднее. Расчет векторизован и может
+     обновляться инкрементально по мере поступления новых записей на занятия.
+
+    Configurable churn-risk scoring of users. Rules are pluggable, every rule returns score from 0 to 1 for
+     every user and the total score is the weighted mean. Evaluation is vectorized and can be updated
+     incrementally as new lesson records arrive.
+
+    A rule is any object with name, weight attributes and evaluate(context) method returning a series of
+     scores indexed by userId.
+
+    Example:
+        engine = RiskScoringEngine([RecentAttendanceRule(window_days=31, last_n=2), SubscriptionExpiryRule(7)])
+        result_df = engine.score(RiskContext(lesson_records_frame(lessons_df), memberships=joins_df))
+    """
+
+    def __init__(self, rules=None, threshold=0.5):
+        """
+        :param rules: list of rules ( RecentAttendanceRule() by default )
+        :param threshold: users with score >= threshold are at risk
+        """
+        self.rules = rules if rules is not None else [RecentAttendanceRule()]
+        self.threshold = threshold
+        self.context = None
+        self.result = None
+
+    def _evaluate(self, context):
+        scores = pd.DataFrame({rule.name: rule.evaluate(context) for rule in self.rules})
+        scores.index = scores.index.astype('int64')
+        scores.index.name = 'userId'
+        weights = pd.Series({rule.name: rule.weight for rule in self.rules})
+        available = scores.notna()
+        total = (scores.fillna(0.0) * weights).sum(axis=1) / (available * weights).sum(axis=1)
+        result = scores.astype(float)
+        result['score'] = total.astype(float)
+        result['at_risk'] = (result['score'] >= self.threshold).astype(bool)
+        return result.dropna(subset=['score'])
+
+    def score(self, context):
+        """
+        Считает оценки для всех учеников
+
+        Scores all users
+
+        :param context: RiskContext object
+        :return: dataframe indexed by userId with one column per rule, 'score' ( float ) and 'at_risk' ( bool )
+        """
+        self.context = context
+        self.result = self._evaluate(context)
+        return self.result
+
+    def update(self, records, as_of=None):
+        """
+        Добавляет новые или измененные записи на занятия и пересчитывает только затронутых учеников
+
+        Adds new or changed lesson records and rescores only affected users
+
+        :param records: dataframe with RECORD_COLUMNS ( see lesson_records_frame )
+        :param as_of: new date of the scoring ( the previous one by default )
+        :return: full result dataframe
+        """
+        if (self.context is None):
+            raise ValueError("Call score() before update()")
+        records = _typed_records(records)
+        old = self.context.records
+        old = old[~old['recordId'].isin(records['recordId'].dropna())]
+        self.context = RiskContext(pd.concat([old, records], ignore_index=True), self.context.memberships,
+                                   self.context.subscriptions, as_of if as_of is not None else self.context.as_of)
+        if (as_of is not None):
+            # all windows moved, so every user has to be rescored
+            self.result = self._evaluate(self.context)
+            return self.result
+        affected = records['userId'].dropna().unique()
+        rescored = self._evaluate(self.context.restricted(affected))
+        self.result = pd.concat([self.result[~self.result.index.isin(affected)], rescored]).sort_index()
+        return self.result
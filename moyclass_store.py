@@ -0,0 +1,258 @@
+# coding=utf-8
+import os
+import json
+import sqlite3
+import pandas as pd
+
+
+class MoyClassStore:
+    """
+    Локальное хранилище сущностей MoyClass на базе SQLite. Данные, загруженные через data_load, сохраняются в
+     таблицы с индексами по частым ключам фильтрации, а повторные аналитические запросы выполняются локально.
+
+    Local SQLite-backed store of MoyClass entities. Data downloaded with data_load is synced into tables indexed
+     by common filter keys, so repeated analytical queries run locally instead of against the remote API.
+
+    Example:
+        store = MoyClassStore()
+        api.data_load(api.get_lessons, 'lessons', params=params, store=store)
+        lessons_df = store.to_df('lessons', params=[['classId', 5]])
+        # store.get_lessons returns the same format as api.get_lessons, but it shouldn't be passed to data_load:
+        #  data_load would overwrite the full 'lessons_df.pkl' file with the filtered lessons
+    """
+
+    # Индексируемые ключи фильтрации ( indexed filter keys )
+    INDEXED_KEYS = ['userId', 'classId', 'date', 'filialId', 'statusId']
+    # Ключи с поиском по дате или диапазону дат ( keys searched by date or by date range )
+    RANGE_KEYS = ['date', 'createdAt', 'updatedAt', 'stateChangedAt', 'sellDate', 'beginDate', 'endDate']
+    COLUMNS = INDEXED_KEYS + ['createdAt', 'updatedAt', 'stateChangedAt', 'sellDate', 'beginDate', 'endDate',
+                              'invoiceId', 'lessonId', 'managerId', 'optype']
+    # Поля объектов, которые отличаются от названия фильтра ( entity fields named differently from the filter )
+    FIELD_ALIASES = {'lessons': {'statusId': 'status'}}
+    # Параметры, которые не фильтруют данные ( params that don't filter data )
+    PAGING_KEYS = ['offset', 'limit', 'sort', 'sortDirection']
+
+    def __init__(self, path='saved_data/moyclass.db'):
+        """
+        :param path: path to the SQLite database file. Use ':memory:' for a temporary in-memory store
+        """
+        self.path = path
+        folder = os.path.dirname(path)
+        if (folder and not os.path.exists(folder)):
+            os.makedirs(folder)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._tables = set()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _json_default(value):
+        # numpy scalars and arrays come from pandas frames
+        if hasattr(value, 'tolist'):
+            return value.tolist()
+        return str(value)
+
+    @classmethod
+    def _clean(cls, value):
+        """
+        Заменяет NaN / NaT из датафреймов на None, чтобы в базу записывался корректный JSON
+
+        Replaces NaN / NaT coming from dataframes with None, so valid JSON is written to the database
+        """
+        if (isinstance(value, dict)):
+            return {key: cls._clean(item) for key, item in value.items()}
+        if (isinstance(value, (list, tuple))):
+            return [cls._clean(item) for item in value]
+        if (hasattr(value, 'tolist') and getattr(value, 'ndim', 0) > 0):
+            return cls._clean(value.tolist())
+        if (value is pd.NaT or value is pd.NA):
+            return None
+        if (hasattr(value, 'item')):
+            value = value.item()
+        if (isinstance(value, float) and value != value):
+            return None
+        return value
+
+    def _table(self, entity_name):
+        if (not entity_name.isidentifier()):
+            raise ValueError(f"Wrong entity name: {entity_name}")
+        if (entity_name not in self._tables):
+            columns = ", ".join(f"{col} {'TEXT' if col in self.RANGE_KEYS or col == 'optype' else 'INTEGER'}"
+                                for col in self.COLUMNS)
+            with self.connection:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {entity_name} (id INTEGER PRIMARY KEY, {columns}, data TEXT)")
+                for key in self.INDEXED_KEYS:
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {entity_name}_{key} ON {entity_name} ({key})")
+            self._tables.add(entity_name)
+        return entity_name
+
+    def _field(self, entity_name, key):
+        return self.FIELD_ALIASES.get(entity_name, {}).get(key, key)
+
+    def _row(self, entity_name, item):
+        row = [item['id']]
+        for col in self.COLUMNS:
+            value = item.get(self._field(entity_name, col))
+            if (isinstance(value, (list, dict))):
+                value = None
+            elif (hasattr(value, 'item')):
+                value = value.item()
+            if (isinstance(value, float) and value != value):  # NaN from pandas
+                value = None
+            row.append(value)
+        row.append(json.dumps(self._clean(item), ensure_ascii=False, allow_nan=False, default=self._json_default))
+        return row
+
+    def sync(self, entity_name, data, replace=False):
+        """
+        Записывает сущности в хранилище ( вставка или обновление по id )
+
+        Upserts entities into the store by id
+
+        :param entity_name: name of the entities, e.g. "users", "lessons", "joins"
+        :param data: dataframe or list of dictionaries as returned by data_load / get_* functions
+        :param replace: if True all previously stored entities of this type are removed first
+        :return: number of synced entities
+        """
+        table = self._table(entity_name)
+        if (isinstance(data, pd.DataFrame)):
+            data = data.to_dict(orient='records')
+        rows = [self._row(entity_name, item) for item in data]
+        placeholders = ", ".join(["?"] * (len(self.COLUMNS) + 2))
+        with self.connection:
+            if (replace):
+                self.connection.execute(f"DELETE FROM {table}")
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {table} (id, {', '.join(self.COLUMNS)}, data) VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def delete(self, entity_name, ids):
+        """
+        Удаляет сущности из хранилища по id
+
+        Deletes entities from the store by id
+
+        :param entity_name: name of the entities
+        :param ids: list of entity ids
+        """
+        table = self._table(entity_name)
+        with self.connection:
+            self.connection.executemany(f"DELETE FROM {table} WHERE id = ?", [[int(i)] for i in ids])
+
+    @staticmethod
+    def _group_params(params):
+        grouped = {}
+        if (params is None):
+            return grouped
+        if (isinstance(params, dict)):
+            params = [[key, v] for key, value in params.items()
+                      for v in (value if isinstance(value, (list, tuple)) else [value])]
+        for key, value in params:
+            grouped.setdefault(key, []).append(value)
+        return grouped
+
+    def _where(self, entity_name, grouped):
+        conditions, args = [], []
+        for key, values in grouped.items():
+            if (key in self.PAGING_KEYS or key.startswith('include') or key.startswith('append')):
+                continue
+            if (key == 'id'):
+                conditions.append(f"id IN ({', '.join(['?'] * len(values))})")
+                args += [int(v) for v in values]
+            elif (key == 'userId' and entity_name == 'lessons'):
+                # lessons are linked to users only through lesson records ( includeRecords=true )
+                conditions.append(f"EXISTS (SELECT 1 FROM json_each({entity_name}.data, '$.records') "
+                                  f"WHERE json_extract(value, '$.userId') IN ({', '.join(['?'] * len(values))}))")
+                args += [int(v) for v in values]
+            elif (key in self.RANGE_KEYS):
+                if (len(values) == 1):
+                    conditions.append(f"substr({key}, 1, 10) = ?")
+                else:
+                    conditions.append(f"substr({key}, 1, 10) BETWEEN ? AND ?")
+                args += [str(v)[:10] for v in values[:2]]
+            elif (key in self.COLUMNS):
+                conditions.append(f"{key} IN ({', '.join(['?'] * len(values))})")
+                args += [int(v) if str(v).lstrip('-').isdigit() else v for v in values]
+            else:
+                raise ValueError(f"Filter '{key}' is not supported by the local store")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, args
+
+    def query(self, entity_name, params=None):
+        """
+        Производит поиск сущностей в локальном хранилище. Параметры совпадают с параметрами get_* функций.
+
+        Searches for entities in the local store. Params mirror the params of get_* functions:
+         dates with one value are searched by date, with two values by range; repeated keys mean "any of".
+
+        :param entity_name: name of the entities
+        :param params: query parameters [ list of pairs or dict ]
+        :return: list of dictionaries
+        """
+        table = self._table(entity_name)
+        grouped = self._group_params(params)
+        where, args = self._where(entity_name, grouped)
+        sort = grouped.get('sort', ['id'])[0]
+        if (sort != 'id' and sort not in self.COLUMNS):
+            raise ValueError(f"Sorting by '{sort}' is not supported by the local store")
+        direction = 'DESC' if grouped.get('sortDirection', ['asc'])[0] == 'desc' else 'ASC'
+        sql = f"SELECT data FROM {table}{where} ORDER BY {sort} {direction}"
+        if ('limit' in grouped or 'offset' in grouped):
+            sql += " LIMIT ? OFFSET ?"
+            args += [int(grouped.get('limit', [-1])[0]), int(grouped.get('offset', [0])[0])]
+        return [json.loads(row[0]) for row in self.connection.execute(sql, args)]
+
+    def count(self, entity_name, params=None):
+        """
+        Возвращает количество сущностей, подходящих под фильтр
+
+        Returns number of entities matching the filter
+        """
+        table = self._table(entity_name)
+        where, args = self._where(entity_name, self._group_params(params))
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}{where}", args).fetchone()[0]
+
+    def get(self, entity_name, params=None):
+        """
+        Возвращает сущности в том же формате, что и API: { entity_name: [...], "stats": { "totalItems": n } },
+         поэтому код, работающий с ответами API, может читать и хранилище. Функции хранилища нельзя передавать
+         в data_load: он перезапишет полный pickle файл отфильтрованными сущностями ( используйте to_df )
+
+        Returns entities in the API format: { entity_name: [...], "stats": { "totalItems": n } },
+         so code working with API responses can read the store as well. Store functions must not be passed to
+         data_load: it would overwrite the full pickle file with the filtered entities ( use to_df instead )
+        """
+        return {entity_name: self.query(entity_name, params),
+                'stats': {'totalItems': self.count(entity_name, params)}}
+
+    def to_df(self, entity_name, params=None):
+        """
+        Возвращает сущности, подходящие под фильтр, в виде датафрейма
+
+        Returns entities matching the filter as dataframe
+        """
+        return pd.DataFrame(self.query(entity_name, params))
+
+    def get_users(self, params=None):
+        return self.get('users', params)
+
+    def get_joins(self, params=None):
+        return self.get('joins', params)
+
+    def get_lessons(self, params=None):
+        return self.get('lessons', params)
+
+    def get_lesson_records(self, params=None):
+        return self.get('lessonRecords', params)
+
+    def get_payments(self, params=None):
+        return self.get('payments', params)
+
+    def get_invoices(self, params=None):
+        return self.get('invoices', params)
+
+    def get_userSubscriptions(self, params=None):
+        return self.get('subscriptions', params)
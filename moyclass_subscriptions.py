@@ -0,0 +1,168 @@
+# coding=utf-8
+import os
+import pickle as pkl
+from datetime import datetime, timedelta
+import pandas as pd
+from moyclass_diff import row_hashes
+from moyclass_cache import atomic_pickle
+
+
+def _column(df, name):
+    return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+class SubscriptionBalanceEngine:
+    """
+    Считает остатки абонементов учеников сразу для всех активных и замороженных абонементов:
+     количество оставшихся занятий, прогнозную дату их окончания и дату окончания с учетом заморозки.
+     Состояние сохраняется между запусками, поэтому ежедневное обновление загружает только новые записи на занятия
+     и пересчитывает только затронутые абонементы.
+
+    Computes balances of all active and frozen users subscriptions at once: remaining visits, projected
+     exhaustion date and freeze-adjusted end date. State is kept between runs, so a daily refresh loads only new
+     lesson records and recomputes only touched subscriptions.
+
+    Example:
+        engine = SubscriptionBalanceEngine(api)
+        balances_df = engine.refresh()
+    """
+
+    STATUSES = [2, 3]  # 2 - Активный ( active ), 3 - Заморожен ( frozen )
+    COLUMNS = ['userId', 'statusId', 'visitCount', 'used_visits', 'remaining_visits', 'last_visit',
+               'visits_per_day', 'projected_exhaustion', 'end_date', 'freeze_days', 'adjusted_end_date']
+
+    def __init__(self, api, state_path='saved_data/subscription_balances.pkl', overlap_days=3):
+        """
+        :param api: MoyClassCompanyAPI object
+        :param state_path: pickle file with the engine state
+        :param overlap_days: lesson records of this many days before the last refresh are reloaded, since
+         attendance is often marked after the lesson
+        """
+        self.api = api
+        self.state_path = state_path
+        self.overlap_days = overlap_days
+        self.print_Flag = True
+        self.state = None
+        if (os.path.exists(state_path)):
+            with open(state_path, 'rb') as f:
+                self.state = pkl.load(f)
+
+    def _save_state(self):
+        atomic_pickle(self.state_path, self.state)
+
+    def _load_subscriptions(self):
+        params = [['statusId', status] for status in self.STATUSES]
+        subscriptions = []
+        for page in self.api.iter_pages(self.api.get_userSubscriptions, 'subscriptions', params):
+            subscriptions += page['subscriptions']
+        return pd.DataFrame(subscriptions)
+
+    def _load_usage(self, date_from, date_to):
+        """
+        Загружает записи на занятия со списаниями и возвращает датафрейм ( recordId, userSubscriptionId, date )
+
+        Loads lesson records with bills and returns dataframe ( recordId, userSubscriptionId, date )
+        """
+        params = [['date', f"{date_from}"], ['date', f"{date_to}"], ['includeBills', 'true']]
+        rows = []
+        for page in self.api.iter_pages(self.api.get_lesson_records, 'lessonRecords', params):
+            for record in page['lessonRecords']:
+                for bill in (record.get('bills') or []):
+                    if (bill.get('userSubscriptionId')):
+                        rows.append([record['id'], bill['userSubscriptionId'], record.get('date')])
+        usage = pd.DataFrame(rows, columns=['recordId', 'userSubscriptionId', 'date'])
+        usage['date'] = pd.to_datetime(usage['date'], errors='coerce')
+        return usage.drop_duplicates(['recordId', 'userSubscriptionId'])
+
+    @classmethod
+    def compute(cls, subscriptions, usage):
+        """
+        Векторизованный расчет остатков для переданных абонементов
+
+        Vectorized balance calculation for the given subscriptions
+
+        :param subscriptions: users subscriptions dataframe
+        :param usage: dataframe ( recordId, userSubscriptionId, date ) of visits charged from subscriptions
+        :return: dataframe indexed by userSubscriptionId with COLUMNS
+        """
+        subs = subscriptions.set_index('id')
+        stats = usage.groupby('userSubscriptionId')['date'].agg(['count', 'max'])
+        result = pd.DataFrame(index=subs.index)
+        result.index.name = 'userSubscriptionId'
+        for col in ['userId', 'statusId']:
+            result[col] = subs[col] if col in subs.columns else pd.NA
+        result['visitCount'] = pd.to_numeric(_column(subs, 'visitCount'), errors='coerce')
+        result['used_visits'] = stats['count'].reindex(result.index).fillna(0).astype(int)
+        result['last_visit'] = stats['max'].reindex(result.index)
+        # visitCount 0 or empty means subscription without visits limit
+        limited = result['visitCount'] > 0
+        result['remaining_visits'] = (result['visitCount'] - result['used_visits']).clip(lower=0).where(limited)
+
+        begin = pd.to_datetime(_column(subs, 'beginDate'), errors='coerce')
+        days_used = (result['last_visit'] - begin).dt.days.clip(lower=1)
+        result['visits_per_day'] = result['used_visits'] / days_used
+        days_left = result['remaining_visits'] / result['visits_per_day'].where(result['visits_per_day'] > 0)
+        result['projected_exhaustion'] = result['last_visit'] + pd.to_timedelta(days_left.round(), unit='D')
+
+        result['end_date'] = pd.to_datetime(_column(subs, 'endDate'), errors='coerce')
+        freeze_from = pd.to_datetime(_column(subs, 'freezeFrom'), errors='coerce')
+        freeze_to = pd.to_datetime(_column(subs, 'freezeTo'), errors='coerce')
+        freeze_days = ((freeze_to - freeze_from).dt.days + 1).where(freeze_from <= result['end_date'])
+        result['freeze_days'] = freeze_days.fillna(0).astype(int)
+        result['adjusted_end_date'] = result['end_date'] + pd.to_timedelta(result['freeze_days'], unit='D')
+        return result[cls.COLUMNS]
+
+    def refresh(self, full=False):
+        """
+        Обновляет остатки абонементов. При первом запуске ( или full=True ) загружаются все записи с даты начала
+         самого раннего абонемента, иначе - только записи с даты последнего обновления.
+
+        Refreshes subscription balances. On the first run ( or with full=True ) all records since the earliest
+         subscription begin date are loaded, otherwise only records since the last refresh.
+
+        :return: dataframe indexed by userSubscriptionId with COLUMNS
+        """
+        today = datetime.today().date()
+        subscriptions = self._load_subscriptions()
+        if (not len(subscriptions)):
+            self.state = {'last_refresh': today, 'fingerprints': pd.Series(dtype='uint64'),
+                          'usage': pd.DataFrame(columns=['recordId', 'userSubscriptionId', 'date']),
+                          'balances': pd.DataFrame(columns=self.COLUMNS)}
+            self._save_state()
+            return self.state['balances']
+
+        fingerprints = row_hashes(subscriptions)
+        if (full or self.state is None):
+            begin = pd.to_datetime(_column(subscriptions, 'beginDate'), errors='coerce').min()
+            date_from = begin.date() if not pd.isnull(begin) else today
+            usage = self._load_usage(date_from, today)
+            touched = subscriptions['id']
+            balances = pd.DataFrame(columns=self.COLUMNS)
+        else:
+            date_from = self.state['last_refresh'] - timedelta(days=self.overlap_days)
+            new_usage = self._load_usage(date_from, today)
+            old_usage = self.state['usage']
+            # records of the reloaded window are replaced, so deleted records stop being counted
+            reloaded = old_usage['date'] >= pd.Timestamp(date_from)
+            changed_usage = pd.concat([old_usage[reloaded], new_usage])
+            changed_usage = changed_usage[~changed_usage.duplicated(['recordId', 'userSubscriptionId'], keep=False)]
+            usage = pd.concat([old_usage[~reloaded], new_usage], ignore_index=True)
+            usage = usage.drop_duplicates(['recordId', 'userSubscriptionId'], keep='last')
+
+            old_fingerprints = self.state['fingerprints'].reindex(fingerprints.index)
+            changed_subs = fingerprints.index[(old_fingerprints != fingerprints).values]
+            touched = pd.Index(changed_subs).union(pd.Index(changed_usage['userSubscriptionId'].unique()))
+            balances = self.state['balances']
+        usage = usage[usage['userSubscriptionId'].isin(subscriptions['id'])]
+
+        current = subscriptions[subscriptions['id'].isin(touched)]
+        recomputed = self.compute(current, usage[usage['userSubscriptionId'].isin(current['id'])])
+        balances = balances[balances.index.isin(subscriptions['id']) & ~balances.index.isin(recomputed.index)]
+        balances = pd.concat([balances, recomputed]).sort_index()
+        balances.index.name = 'userSubscriptionId'
+
+        self.state = {'last_refresh': today, 'fingerprints': fingerprints, 'usage': usage, 'balances': balances}
+        self._save_state()
+        if (self.print_Flag):
+            print(f"Subscription balances refreshed: {len(recomputed)} of {len(balances)} recomputed")
+        return balances
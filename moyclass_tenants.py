@@ -0,0 +1,130 @@
+# coding=utf-8
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from moyclass import MoyClassCompanyAPI, MoyClassTransport, PageSizeTuner
+
+
+class MoyClassTenantPool:
+    """
+    Пул клиентов API для нескольких компаний ( школ ), у каждой из которых свой api_key. Клиенты создаются
+     и авторизуются при первом обращении, все они используют один пул соединений ( MoyClassTransport ),
+     частота запросов ограничивается для каждой компании и для всех компаний вместе.
+
+    Pool of API clients for many companies ( schools ), each with its own api_key. Clients are created and
+     authenticated on first use, all of them share one connection pool ( MoyClassTransport ), request rate
+     is limited per company and globally.
+
+    Example:
+        pool = MoyClassTenantPool({'school_1': api_key_1, 'school_2': api_key_2}, tenant_rate_limit=5,
+                                  global_rate_limit=20)
+        payments = pool.fan_out('get_payments', [['date', '2021-11-18'], ['date', '2021-11-18']])
+        # { 'school_1': {...}, 'school_2': {...} }
+        payments_df = pool.load('get_payments', 'payments', [['date', '2021-11-18'], ['date', '2021-11-18']])
+        # dataframe of all payments with 'tenant' column
+    """
+
+    def __init__(self, api_keys, tenant_rate_limit=5, global_rate_limit=None, jobs=8, pool_size=None,
+                 transport=None, data_folder='saved_data'):
+        """
+        :param api_keys: dictionary { tenant name : api_key }
+        :param tenant_rate_limit: maximal number of requests per second for one tenant ( None - no limit )
+        :param global_rate_limit: maximal number of requests per second for all tenants ( None - no limit )
+        :param jobs: number of tenants queried concurrently
+        :param pool_size: size of the shared connection pool ( jobs by default )
+        :param transport: MoyClassTransport object ( created from the params above by default )
+        :param data_folder: folder of tenants page size files
+        """
+        self.api_keys = dict(api_keys)
+        self.jobs = jobs
+        self.data_folder = data_folder
+        self.print_Flag = True
+        self.transport = transport if transport is not None else MoyClassTransport(
+            pool_size=pool_size or jobs, rate_limit=tenant_rate_limit, global_rate_limit=global_rate_limit)
+        self.errors = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tenants(self):
+        return list(self.api_keys)
+
+    def client(self, tenant):
+        """
+        Возвращает клиента API компании ( создается при первом обращении, токен получается при первом запросе )
+
+        Returns API client of the tenant ( created on first use, the token is obtained on the first request )
+        """
+        with self._lock:
+            if (tenant not in self._clients):
+                client = MoyClassCompanyAPI(self.api_keys[tenant], transport=self.transport, lazy_auth=True)
+                client.print_Flag = self.print_Flag
+                # tenants have different data, so page sizes are learned separately
+                client.page_size_tuner = PageSizeTuner(path=f"{self.data_folder}/page_sizes_{tenant}.json",
+                                                       default_size=client.DEFAULT_PAGE_SIZE)
+                self._clients[tenant] = client
+            return self._clients[tenant]
+
+    def fan_out(self, query, *args, tenants=None, **kwargs):
+        """
+        Выполняет один и тот же запрос для всех компаний параллельно. Ошибки отдельных компаний не прерывают
+         остальные запросы и сохраняются в self.errors
+
+        Runs the same query for all tenants concurrently. Errors of single tenants don't stop other queries
+         and are saved to self.errors
+
+        :param query: name of MoyClassCompanyAPI method ( 'get_payments' ) or function called as query(client)
+        :param args: arguments of the method
+        :param tenants: list of tenants ( all tenants by default )
+        :param kwargs: keyword arguments of the method
+        :return: dictionary { tenant : result } for tenants without errors
+        """
+        tenants = self.tenants if tenants is None else list(tenants)
+
+        def run(tenant):
+            client = self.client(tenant)
+            if (callable(query)):
+                return query(client)
+            return getattr(client, query)(*args, **kwargs)
+
+        results = {}
+        self.errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.jobs, len(tenants)))) as executor:
+            futures = {tenant: executor.submit(run, tenant) for tenant in tenants}
+            for tenant, future in futures.items():
+                try:
+                    results[tenant] = future.result()
+                except Exception as err:
+                    self.errors[tenant] = err
+                    if (self.print_Flag):
+                        print(f"Tenant {tenant} failed: {err}")
+        return results
+
+    def load(self, query, entity_name, params=None, tenants=None):
+        """
+        Загружает все страницы объектов для всех компаний параллельно и объединяет их в один датафрейм
+         со столбцом 'tenant'
+
+        Loads all pages of entities for all tenants concurrently and joins them into one dataframe
+         with 'tenant' column
+
+        :param query: name of MoyClassCompanyAPI method ( 'get_payments' )
+        :param entity_name: name of entities list in the response ( 'payments' )
+        :param params: query parameters [ list of pairs ]
+        :param tenants: list of tenants ( all tenants by default )
+        :return: dataframe
+        """
+        def load_tenant(client):
+            items = []
+            for page in client.iter_pages(getattr(client, query), entity_name, params):
+                items += page[entity_name] if type(page) == dict else page
+            return items
+
+        frames = []
+        for tenant, items in self.fan_out(load_tenant, tenants=tenants).items():
+            df = pd.DataFrame(items)
+            df.insert(0, 'tenant', tenant)
+            frames.append(df)
+        if (not frames):
+            return pd.DataFrame(columns=['tenant'])
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,183 @@
+# coding=utf-8
+import os
+import io
+import json
+import hmac
+import threading
+import pickle as pkl
+import pandas as pd
+from wsgiref.util import setup_testing_defaults
+from wsgiref.simple_server import make_server
+from moyclass_cache import file_lock, atomic_pickle
+
+
+class MoyClassWebhookReceiver:
+    """
+    Приемник вебхуков MoyClass. Получает события об изменениях и применяет их к локальным данным:
+     pickle файлам в папке 'saved_data' ( созданным data_load ) и к MoyClassStore, если он передан.
+
+    MoyClass webhook receiver. Accepts change events and applies upserts / deletes to the local data:
+     pickle files in 'saved_data' folder ( created by data_load ) and to MoyClassStore if it is passed.
+
+    The receiver is a WSGI application, so it can be embedded into any WSGI server or run locally:
+        receiver = MoyClassWebhookReceiver(store=store)
+        receiver.serve(port=8080)
+
+    Event format:
+        { "event": "user_changed", "object": { "id": 1, ... } }
+        { "event": "join_deleted", "object": { "id": 5 } }
+    """
+
+    # Префикс события -> название сущности ( event prefix -> entity name )
+    ENTITY_NAMES = {'user': 'users', 'join': 'joins', 'lesson': 'lessons', 'lessonRecord': 'lessonRecords',
+                    'lesson_record': 'lessonRecords', 'payment': 'payments', 'invoice': 'invoices',
+                    'userSubscription': 'subscriptions', 'user_subscription': 'subscriptions'}
+    UPSERT_ACTIONS = ['new', 'created', 'changed', 'updated', 'status']
+    DELETE_ACTIONS = ['deleted', 'removed']
+
+    def __init__(self, store=None, update_pickles=True, data_folder='saved_data', secret=None):
+        """
+        :param store: MoyClassStore object to keep up to date ( optional )
+        :param update_pickles: if True '{entity_name}_df.pkl' files in data_folder are updated as well
+        :param data_folder: folder with data_load pickle files
+        :param secret: if set, requests must contain the same value in 'X-Webhook-Secret' header
+        """
+        self.store = store
+        self.update_pickles = update_pickles
+        self.data_folder = data_folder
+        self.secret = secret
+        self.print_Flag = True
+        self._lock = threading.Lock()
+
+    def parse_event(self, event):
+        """
+        Возвращает ( название сущности, действие, объект ) для события или None, если событие не поддерживается
+
+        Returns ( entity name, action, object ) for the event or None if the event isn't supported.
+         Action is 'upsert' or 'delete'.
+        """
+        name = event.get('event', '')
+        obj = event.get('object', event.get('data'))
+        if (not isinstance(obj, dict) or 'id' not in obj):
+            return None
+        prefix, _, action = name.rpartition('_')
+        if (prefix in self.ENTITY_NAMES and action in self.UPSERT_ACTIONS):
+            return self.ENTITY_NAMES[prefix], 'upsert', obj
+        if (prefix in self.ENTITY_NAMES and action in self.DELETE_ACTIONS):
+            return self.ENTITY_NAMES[prefix], 'delete', obj
+        # events like "join_changed_status". Longer prefixes go first, so "user_subscription_..." is not taken
+        # for a "user" event
+        for entity_prefix in sorted(self.ENTITY_NAMES, key=len, reverse=True):
+            entity_name = self.ENTITY_NAMES[entity_prefix]
+            if (name.startswith(entity_prefix + '_')):
+                rest = name[len(entity_prefix) + 1:].split('_')
+                if (any(part in self.DELETE_ACTIONS for part in rest)):
+                    return entity_name, 'delete', obj
+                if (any(part in self.UPSERT_ACTIONS for part in rest)):
+                    return entity_name, 'upsert', obj
+        return None
+
+    def _update_pickle(self, entity_name, action, obj):
+        data_path = os.path.join(self.data_folder, f"{entity_name}_df.pkl")
+        if (not os.path.exists(data_path)):
+            return
+        # several worker processes can receive events at once, so read-modify-write is done under a file lock
+        with file_lock(data_path + '.lock'):
+            with open(data_path, 'rb') as f:
+                df = pkl.load(f)
+            if ('id' in df.columns):
+                df = df[df['id'] != obj['id']]
+            if (action == 'upsert'):
+                df = pd.concat([df, pd.DataFrame([obj])], ignore_index=True)
+            atomic_pickle(data_path, df.reset_index(drop=True))
+
+    def handle_event(self, event):
+        """
+        Применяет событие к локальным данным
+
+        Applies the event to the local data
+
+        :param event: event dictionary
+        :return: True if the event was applied, False if it was ignored
+        """
+        parsed = self.parse_event(event)
+        if (parsed is None):
+            if (self.print_Flag):
+                print(f"Webhook event ignored: {event.get('event')}")
+            return False
+        entity_name, action, obj = parsed
+        with self._lock:
+            if (self.store is not None):
+                if (action == 'upsert'):
+                    self.store.sync(entity_name, [obj])
+                else:
+                    self.store.delete(entity_name, [obj['id']])
+            if (self.update_pickles):
+                self._update_pickle(entity_name, action, obj)
+        return True
+
+    def __call__(self, environ, start_response):
+        if (environ.get('REQUEST_METHOD') != 'POST'):
+            return self._respond(start_response, '405 Method Not Allowed', {'error': 'POST expected'})
+        received_secret = environ.get('HTTP_X_WEBHOOK_SECRET', '').encode('utf-8')
+        if (self.secret is not None and not hmac.compare_digest(received_secret, self.secret.encode('utf-8'))):
+            return self._respond(start_response, '403 Forbidden', {'error': 'wrong secret'})
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = json.loads(environ['wsgi.input'].read(length) or b'{}')
+        except (ValueError, TypeError):
+            return self._respond(start_response, '400 Bad Request', {'error': 'wrong json'})
+        events = body if isinstance(body, list) else [body]
+        applied = sum(self.handle_event(event) for event in events if isinstance(event, dict))
+        return self._respond(start_response, '200 OK', {'applied': applied, 'received': len(events)})
+
+    @staticmethod
+    def _respond(start_response, status, body):
+        data = json.dumps(body).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(data)))])
+        return [data]
+
+    def serve(self, host='127.0.0.1', port=8080):
+        """
+        Запускает приемник на локальном WSGI сервере
+
+        Runs the receiver on a local WSGI server
+        """
+        with make_server(host, port, self) as server:
+            if (self.print_Flag):
+                print(f"Webhook receiver is listening on http://{host}:{port}")
+            server.serve_forever()
+
+    def test_client(self):
+        return WebhookTestClient(self)
+
+
+class WebhookTestClient:
+    """
+    Тестовый клиент для отправки событий в приемник без запуска сервера
+
+    Test client that posts events to the receiver without running a server
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def post(self, event, headers=None):
+        """
+        :param event: event dictionary or list of events
+        :param headers: extra headers, e.g. {'X-Webhook-Secret': '...'}
+        :return: ( status, response body as dict )
+        """
+        data = json.dumps(event).encode('utf-8')
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(data)), 'wsgi.input': io.BytesIO(data),
+                   'CONTENT_TYPE': 'application/json'}
+        for key, value in (headers or {}).items():
+            environ['HTTP_' + key.upper().replace('-', '_')] = value
+        setup_testing_defaults(environ)
+        result = {}
+
+        def start_response(status, response_headers):
+            result['status'] = status
+
+        body = b''.join(self.app(environ, start_response))
+        return result['status'], json.loads(body)
@@ -0,0 +1,451 @@
+# coding=utf-8
+import os
+import json
+import time
+import uuid
+import sqlite3
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import requests
+
+
+class WriteJournal:
+    """
+    Локальный журнал операций записи на базе SQLite. Для каждого ключа идемпотентности хранится операция,
+     ее данные, статус ( 'pending', 'done', 'failed' ) и ответ сервера.
+
+    Local SQLite journal of write operations. For every idempotency key the operation, its payload,
+     status ( 'pending', 'done', 'failed' ) and server response are stored.
+    """
+
+    def __init__(self, path='saved_data/writes.db'):
+        """
+        :param path: path to the SQLite database file. Use ':memory:' for a temporary journal
+        """
+        self.path = path
+        folder = os.path.dirname(path)
+        if (folder and not os.path.exists(folder)):
+            os.makedirs(folder)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS writes (key TEXT PRIMARY KEY, operation TEXT, payload TEXT, "
+                "status TEXT, entity_id INTEGER, response TEXT, created REAL, updated REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS writes_entity ON writes (operation, entity_id)")
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT key, operation, payload, status, entity_id, response, created FROM writes WHERE key = ?",
+                (key,)).fetchone()
+        if (row is None):
+            return None
+        return {'key': row[0], 'operation': row[1], 'payload': json.loads(row[2]), 'status': row[3],
+                'entity_id': row[4], 'response': json.loads(row[5]) if row[5] else None, 'created': row[6]}
+
+    def begin(self, key, operation, payload):
+        """
+        Записывает начало операции ( если ее еще нет в журнале )
+
+        Records start of the operation ( if it is not in the journal yet )
+        """
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO writes (key, operation, payload, status, created, updated) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)", (key, operation, json.dumps(payload, default=str), now, now))
+
+    def finish(self, key, status, response=None):
+        entity_id = response.get('id') if isinstance(response, dict) else None
+        with self._lock, self.connection:
+            self.connection.execute("UPDATE writes SET status = ?, entity_id = ?, response = ?, updated = ? "
+                                    "WHERE key = ?",
+                                    (status, entity_id, json.dumps(response, default=str), time.time(), key))
+
+    def claimed(self, operation, entity_id):
+        """
+        Проверяет, записан ли объект в журнал как результат другой операции
+
+        Checks whether the entity is recorded in the journal as a result of another operation
+        """
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM writes WHERE operation = ? AND entity_id = ?",
+                                           (operation, entity_id)).fetchone() is not None
+
+    def pending(self):
+        """
+        Возвращает незавершенные операции ( например, прерванные падением процесса )
+
+        Returns unfinished operations ( e.g. interrupted by a process crash )
+        """
+        with self._lock:
+            keys = [row[0] for row in self.connection.execute(
+                "SELECT key FROM writes WHERE status = 'pending' ORDER BY created")]
+        return [self.get(key) for key in keys]
+
+    def close(self):
+        self.connection.close()
+
+
+class IdempotentWriter:
+    """
+    Идемпотентная запись через MoyClassCompanyAPI. Каждой операции назначается ключ идемпотентности ( передается
+     в заголовке Idempotency-Key и сохраняется в локальном журнале ). Повторный вызов с тем же ключом возвращает
+     сохраненный результат. Перед повтором после таймаута или ошибки соединения выполняется поиск уже созданного
+     объекта через соответствующий get_* фильтр, поэтому повторы не создают дубликатов.
+
+    Idempotent writes through MoyClassCompanyAPI. Every operation gets an idempotency key ( sent in
+     Idempotency-Key header and saved in the local journal ). A repeated call with the same key returns the saved
+     result. Before a retry after a timeout or connection error the already created entity is looked up with
+     the matching get_* filter, so retries don't create duplicates.
+
+    Example:
+        writer = IdempotentWriter(api)
+        payment = writer.create_payment({'userId': 1, 'date': '2021-11-19', 'summa': 1000, 'optype': 'income',
+                                         'paymentTypeId': 1}, key='kiosk-17-payment-5521')
+    """
+
+    def __init__(self, api, journal=None, retries=5, backoff_factor=0.5):
+        """
+        :param api: MoyClassCompanyAPI object
+        :param journal: WriteJournal object ( saved_data/writes.db by default )
+        :param retries: number of retries after timeouts and connection errors
+        :param backoff_factor: retries wait backoff_factor * 2 ^ ( retry number - 1 ) seconds
+        """
+        self.api = api
+        self.journal = journal if journal is not None else WriteJournal()
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.print_Flag = True
+
+    @staticmethod
+    def make_key(operation, payload=None):
+        """
+        Создает ключ идемпотентности. Без payload ключ случайный, с payload - хэш операции и данных, поэтому
+         одинаковые записи получают одинаковый ключ. write() по умолчанию использует случайный ключ: две реальные
+         одинаковые оплаты не должны объединяться. Ключ по данным передается в write() явно, если повтор тех же
+         данных действительно означает ту же операцию ( например, повторная выгрузка одного файла )
+
+        Creates idempotency key. Without payload the key is random, with payload it is a hash of the operation and
+         the data, so equal writes get equal keys. write() uses a random key by default: two real equal payments
+         must not be merged. Pass a data key to write() explicitly when repeating the same data really means the
+         same operation ( e.g. importing the same file again )
+        """
+        if (payload is None):
+            return str(uuid.uuid4())
+        data = json.dumps([operation, payload], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    # Поиск уже созданных объектов ( lookup of already created entities )
+
+    def _unclaimed(self, operation, items):
+        for item in items:
+            if (not self.journal.claimed(operation, item.get('id'))):
+                return item
+        return None
+
+    def _lookup_payment(self, payment_info, entry):
+        params = [['userId', payment_info['userId']], ['date', payment_info['date']], ['date', payment_info['date']],
+                  ['optype', payment_info['optype']]]
+        items = self.api.get_payments(params).get('payments', [])
+        items = [item for item in items if float(item.get('summa', 0)) == float(payment_info['summa'])
+                 and all(item.get(field) == payment_info[field]
+                         for field in ['paymentTypeId', 'invoiceId', 'userSubscriptionId'] if field in payment_info)]
+        return self._unclaimed('create_payment', items)
+
+    def _lookup_user(self, user_info, entry):
+        created = f"{datetime.fromtimestamp(entry['created']).date()}"
+        params = [['createdAt', created], ['createdAt', f"{datetime.today().date()}"]]
+        for field in ['phone', 'email', 'name']:
+            if (user_info.get(field)):
+                params.append([field, user_info[field]])
+                break
+        items = self.api.get_users(params).get('users', [])
+        items = [item for item in items if item.get('name') == user_info['name']]
+        return self._unclaimed('create_user', items)
+
+    def _lookup_lesson_record(self, lessonRecord_info, entry):
+        # a user can have only one record for a lesson
+        params = [['userId', lessonRecord_info['userId']], ['lessonId', lessonRecord_info['lessonId']]]
+        items = self.api.get_lesson_records(params).get('lessonRecords', [])
+        return items[0] if items else None
+
+    LOOKUPS = {'create_payment': _lookup_payment, 'create_user': _lookup_user,
+               'create_lesson_record': _lookup_lesson_record}
+
+    def write(self, operation, payload, key=None):
+        """
+        Выполняет операцию записи идемпотентно
+
+        Runs the write operation idempotently
+
+        :param operation: name of MoyClassCompanyAPI method: 'create_payment', 'create_user' or
+         'create_lesson_record'
+        :param payload: data of the operation
+        :param key: idempotency key. By default a random key is used, so it protects only the retries of this call;
+         pass a stable key ( e.g. from the source system ) to make repeated calls idempotent
+        :return: server response ( created entity or error )
+        """
+        if (operation not in self.LOOKUPS):
+            raise ValueError(f"Operation should be one of {list(self.LOOKUPS)}")
+        key = key if key is not None else self.make_key(operation)
+        entry = self.journal.get(key)
+        if (entry is not None and entry['status'] == 'done'):
+            if (self.print_Flag):
+                print(f"{operation} with key {key} was already done")
+            return entry['response']
+        # a pending entry means an earlier attempt could have reached the server
+        risky = entry is not None and entry['status'] == 'pending'
+        self.journal.begin(key, operation, payload)
+        entry = self.journal.get(key)
+        for attempt in range(self.retries + 1):
+            try:
+                if (risky):
+                    found = self.LOOKUPS[operation](self, payload, entry)
+                    if (found is not None):
+                        self.journal.finish(key, 'done', found)
+                        if (self.print_Flag):
+                            print(f"{operation} with key {key} was found on the server, not created again")
+                        return found
+                with self.api.transport.extra_headers({'Idempotency-Key': key}):
+                    response = getattr(self.api, operation)(dict(payload))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                risky = True
+                if (attempt < self.retries):
+                    time.sleep(self.backoff_factor * 2 ** attempt)
+                continue
+            status = 'done' if (isinstance(response, dict) and 'id' in response) else 'failed'
+            self.journal.finish(key, status, response)
+            return response
+        raise requests.exceptions.ConnectionError(f"{operation} with key {key} failed after {self.retries} retries, "
+                                                  f"it stays pending and is checked on the next call")
+
+    def resume(self):
+        """
+        Завершает операции, прерванные падением процесса: найденные на сервере отмечаются выполненными,
+         остальные выполняются заново
+
+        Completes operations interrupted by a process crash: the ones found on the server are marked done,
+         the rest are run again
+
+        :return: dictionary { key : response }
+        """
+        return {entry['key']: self.write(entry['operation'], entry['payload'], entry['key'])
+                for entry in self.journal.pending()}
+
+    def create_payment(self, payment_info: dict, key=None):
+        """
+        Идемпотентная версия MoyClassCompanyAPI.create_payment
+
+        Idempotent version of MoyClassCompanyAPI.create_payment
+        """
+        return self.write('create_payment', payment_info, key)
+
+    def create_user(self, user_info: dict, key=None):
+        """
+        Идемпотентная версия MoyClassCompanyAPI.create_user
+
+        Idempotent version of MoyClassCompanyAPI.create_user
+        """
+        return self.write('create_user', user_info, key)
+
+    def create_lesson_record(self, lessonRecord_info: dict, key=None):
+        """
+        Идемпотентная версия MoyClassCompanyAPI.create_lesson_record
+
+        Idempotent version of MoyClassCompanyAPI.create_lesson_record
+        """
+        return self.write('create_lesson_record', lessonRecord_info, key)
+
+
+class WriteBehindQueue:
+    """
+    Очередь отложенной записи: изменения записей на занятия и оценок принимаются сразу, без ожидания ответа
+     сервера, и отправляются фоновыми потоками. Несколько изменений одной и той же записи, ожидающих отправки,
+     объединяются в одно ( более поздние значения полей заменяют ранее переданные ). Изменения одной записи
+     отправляются по порядку, число одновременных запросов ограничено workers, а при max_pending ожидающих
+     записей добавление новой записи ждет освобождения места.
+
+    Write-behind queue: lesson record and mark changes are accepted immediately, without waiting for the server
+     response, and are sent by background threads. Several pending changes of the same record are coalesced into
+     one ( later field values replace earlier ones ). Changes of one record are sent in order, number of concurrent
+     requests is limited by workers, and with max_pending records waiting adding a new record blocks until there
+     is room ( backpressure ).
+
+    Callbacks are called from the worker threads:
+        on_sent(operation, args, payload, response) - after every successful write
+        on_failure(operation, args, payload, error) - after every failed write ( exception or HTTP error )
+        on_drain() - every time the queue becomes empty
+
+    Example:
+        writes = WriteBehindQueue(api, workers=4, on_failure=lambda *failed: retry_later.append(failed))
+        writes.change_lesson_record(recordId, {'visit': True})
+        writes.create_or_change_lesson_mark(lessonId, userId, 'lesson', {'value': 5})
+        writes.flush()  # wait until everything is written
+        writes.close()
+    """
+
+    def __init__(self, api, workers=4, max_pending=1000, on_sent=None, on_failure=None, on_drain=None):
+        """
+        :param api: MoyClassCompanyAPI object
+        :param workers: number of concurrent requests
+        :param max_pending: maximal number of records waiting to be sent
+        """
+        self.api = api
+        self.max_pending = max_pending
+        self.on_sent = on_sent
+        self.on_failure = on_failure
+        self.on_drain = on_drain
+        self.print_Flag = True
+        self.stats = {'accepted': 0, 'coalesced': 0, 'sent': 0, 'failed': 0}
+        self._pending = OrderedDict()  # record key : ( operation, args, payload )
+        self._in_flight = set()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # HTTP errors don't raise in the client, they are taken from the transport events
+        self.api.transport.hooks.append(self._hook)
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def _hook(self, event):
+        if (event['error'] is not None):
+            self._local.error = event['error']
+
+    def submit(self, key, operation, args, payload, timeout=None):
+        """
+        Добавляет изменение в очередь
+
+        Adds a change to the queue
+
+        :param key: key of the changed record, changes with equal keys are coalesced
+        :param operation: name of MoyClassCompanyAPI method called as method(*args, payload)
+        :param timeout: seconds to wait for room in a full queue ( None - wait forever )
+        """
+        with self._cond:
+            if (self._closed):
+                raise RuntimeError("Write-behind queue is closed")
+            self.stats['accepted'] += 1
+            if (key in self._pending):
+                _, _, previous = self._pending[key]
+                self._pending[key] = (operation, args, dict(previous, **payload))
+                self.stats['coalesced'] += 1
+                return
+            if (not self._cond.wait_for(lambda: len(self._pending) < self.max_pending or self._closed, timeout)):
+                self.stats['accepted'] -= 1
+                raise queue.Full(f"{len(self._pending)} writes are waiting to be sent")
+            if (self._closed):
+                raise RuntimeError("Write-behind queue is closed")
+            self._pending[key] = (operation, args, dict(payload))
+            self._cond.notify_all()
+
+    def change_lesson_record(self, recordId, lessonRecord_info: dict, timeout=None):
+        """
+        Отложенная версия MoyClassCompanyAPI.change_lesson_record
+
+        Write-behind version of MoyClassCompanyAPI.change_lesson_record
+        """
+        self.submit(('lesson_record', recordId), 'change_lesson_record', (recordId,), lessonRecord_info, timeout)
+
+    def create_or_change_lesson_mark(self, lessonId, userId, file_type, grade_info: dict, timeout=None):
+        """
+        Отложенная версия MoyClassCompanyAPI.create_or_change_lesson_mark
+
+        Write-behind version of MoyClassCompanyAPI.create_or_change_lesson_mark
+        """
+        self.submit(('lesson_mark', lessonId, userId, file_type), 'create_or_change_lesson_mark',
+                    (lessonId, userId, file_type), grade_info, timeout)
+
+    def _take(self):
+        with self._cond:
+            while True:
+                # the oldest record which is not being sent right now, so changes of one record keep their order
+                for key in self._pending:
+                    if (key not in self._in_flight):
+                        task = self._pending.pop(key)
+                        self._in_flight.add(key)
+                        self._cond.notify_all()
+                        return key, task
+                if (self._closed and not self._pending):
+                    return None
+                self._cond.wait()
+
+    def _callback(self, callback, *args):
+        if (callback is None):
+            return
+        try:
+            callback(*args)
+        except Exception as err:
+            if (self.print_Flag):
+                print(f"Write-behind callback failed: {err}")
+
+    def _worker(self):
+        while True:
+            task = self._take()
+            if (task is None):
+                return
+            key, (operation, args, payload) = task
+            self._local.error = None
+            response = None
+            try:
+                response = getattr(self.api, operation)(*args, dict(payload))
+                error = self._local.error
+            except Exception as err:
+                error = err
+            if (error is None):
+                self._callback(self.on_sent, operation, args, payload, response)
+            else:
+                self._callback(self.on_failure, operation, args, payload, error)
+            with self._cond:
+                self._in_flight.discard(key)
+                self.stats['sent' if error is None else 'failed'] += 1
+                drained = not self._pending and not self._in_flight
+                self._cond.notify_all()
+            if (drained):
+                self._callback(self.on_drain)
+
+    @property
+    def pending(self):
+        """
+        Число изменений, ожидающих отправки или отправляемых сейчас
+
+        Number of changes waiting to be sent or being sent
+        """
+        with self._cond:
+            return len(self._pending) + len(self._in_flight)
+
+    def flush(self, timeout=None):
+        """
+        Ждет отправки всех принятых изменений
+
+        Waits until all accepted changes are sent
+
+        :param timeout: seconds to wait ( None - wait forever )
+        :return: True if the queue is empty, False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def close(self, timeout=None):
+        """
+        Отправляет оставшиеся изменения и останавливает фоновые потоки
+
+        Sends the remaining changes and stops background threads
+
+        :return: True if everything was sent, False on timeout
+        """
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if (flushed):
+            for thread in self._threads:
+                thread.join()
+        if (self._hook in self.api.transport.hooks):
+            self.api.transport.hooks.remove(self._hook)
+        return flushed